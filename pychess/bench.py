@@ -0,0 +1,48 @@
+import argparse
+import time
+from bitboard import BitboardGameState
+from perft import PERFT_SUITE
+from bot import NegamaxBot
+
+# fixed time searches over the perft positions, for measuring search speed and how it scales with --threads
+# every thread count starts from an empty table so the runs are comparable
+
+def run_bench(threads, movetime, hash_mb, root_split=False, depth=None):
+    bot = NegamaxBot(hash_mb=hash_mb, threads=threads, root_split=root_split)
+    bot.verbose = False
+    total_nodes = 0
+    total_time = 0
+    depths = []
+    for name, fen, _ in PERFT_SUITE:
+        game_state = BitboardGameState.from_fen(fen)
+        start = time.perf_counter()
+        if depth is not None:
+            bot.find_best_move(game_state, game_state.get_valid_moves(), depth=depth)
+        else:
+            bot.find_best_move(game_state, game_state.get_valid_moves(), movetime=movetime)
+        total_time += time.perf_counter() - start
+        total_nodes += bot.search_nodes
+        depths.append(bot.completed_depth)
+    bot.close()
+    return total_nodes, total_time, sum(depths) / len(depths)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure search speed over a set of positions.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1], help="thread counts to compare, e.g. --threads 1 2 4 8")
+    parser.add_argument("--movetime", type=int, default=1000, help="milliseconds per position")
+    parser.add_argument("--hash-mb", type=int, default=64)
+    parser.add_argument("--root-split", action="store_true", help="split the root moves over a process pool instead of lazy smp")
+    parser.add_argument("--depth", type=int, default=None, help="search every position to this depth instead of for --movetime")
+    args = parser.parse_args()
+
+    base_nps = None
+    for threads in args.threads:
+        nodes, elapsed, average_depth = run_bench(threads, args.movetime, args.hash_mb, args.root_split, args.depth)
+        nps = nodes / elapsed if elapsed > 0 else 0
+        if base_nps is None:
+            base_nps = nps
+        scaling = nps / base_nps if base_nps else 0
+        print(f"threads {threads:<3} nodes {nodes:<9} time {elapsed:.2f}s  nps {nps:,.0f}  scaling {scaling:.2f}x  average depth {average_depth:.1f}")
+
+if __name__ == "__main__":
+    main()
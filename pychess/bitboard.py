@@ -0,0 +1,349 @@
+from engine import GameState, Move, CheckInfo, PIECE_INDEX, EMPTY, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+
+# squares are indexed the same way as the board array: index = row * 8 + column (a8 = 0, h1 = 63)
+
+PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING = range(6)
+WHITE, BLACK = 0, 1
+
+# (row step, column step, is index increasing)
+NORTH, SOUTH, WEST, EAST = (-1, 0, False), (1, 0, True), (0, -1, False), (0, 1, True)
+NORTH_WEST, NORTH_EAST, SOUTH_WEST, SOUTH_EAST = (-1, -1, False), (-1, 1, False), (1, -1, True), (1, 1, True)
+ORTHOGONAL_DIRECTIONS = (NORTH, SOUTH, WEST, EAST)
+DIAGONAL_DIRECTIONS = (NORTH_WEST, NORTH_EAST, SOUTH_WEST, SOUTH_EAST)
+DIRECTIONS = ORTHOGONAL_DIRECTIONS + DIAGONAL_DIRECTIONS
+
+def _on_board(row, column):
+    return 0 <= row < 8 and 0 <= column < 8
+
+def _step_table(steps):
+    table = []
+    for square in range(64):
+        row, column = divmod(square, 8)
+        mask = 0
+        for row_step, column_step in steps:
+            if _on_board(row + row_step, column + column_step):
+                mask |= 1 << ((row + row_step) * 8 + column + column_step)
+        table.append(mask)
+    return table
+
+def _ray_table(direction):
+    table = []
+    for square in range(64):
+        row, column = divmod(square, 8)
+        mask = 0
+        row, column = row + direction[0], column + direction[1]
+        while _on_board(row, column):
+            mask |= 1 << (row * 8 + column)
+            row, column = row + direction[0], column + direction[1]
+        table.append(mask)
+    return table
+
+KNIGHT_ATTACKS = _step_table(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _step_table(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = (_step_table(((-1, -1), (-1, 1))), _step_table(((1, -1), (1, 1))))  # [color][square]
+RAYS = {direction: _ray_table(direction) for direction in DIRECTIONS}
+
+def _between_table():
+    # squares strictly between two squares on a shared line, 0 if they aren't aligned
+    table = [[0] * 64 for _ in range(64)]
+    for direction in DIRECTIONS:
+        for start in range(64):
+            ray = RAYS[direction][start]
+            while ray:
+                end_bit = ray & -ray if direction[2] else 1 << (ray.bit_length() - 1)
+                end = end_bit.bit_length() - 1
+                table[start][end] = RAYS[direction][start] & ~RAYS[direction][end] & ~end_bit
+                ray ^= end_bit
+    return table
+
+BETWEEN = _between_table()
+
+def sliding_attacks(square, occupied, directions):
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if direction[2]:
+                blocker = (blockers & -blockers).bit_length() - 1  # first blocker is the lowest set bit
+            else:
+                blocker = blockers.bit_length() - 1  # first blocker is the highest set bit
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(square, occupied):
+    return sliding_attacks(square, occupied, ORTHOGONAL_DIRECTIONS)
+
+def bishop_attacks(square, occupied):
+    return sliding_attacks(square, occupied, DIAGONAL_DIRECTIONS)
+
+def iterate_bits(bits):
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+class BitboardGameState(GameState):
+    """
+    Drop-in GameState that generates moves from bitboards.
+
+    The board array is still kept up to date so the gui, the bots and Move
+    keep working; the twelve piece bitboards are updated alongside it in
+    make_move/undo_move and are what get_valid_moves reads from.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.load_bitboards()
+
+    def set_fen(self, fen):
+        super().set_fen(fen)
+        self.load_bitboards()
+
+    def load_bitboards(self):
+        self.pieces = [0] * 12
+        for row in range(8):
+            for column in range(8):
+                piece = self.board[row, column]
+                if piece != "..":
+                    self.pieces[PIECE_INDEX[piece]] |= 1 << (row * 8 + column)
+        self.update_occupancy()
+
+    def update_occupancy(self):
+        pieces = self.pieces
+        white = pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5]
+        black = pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]
+        self.occupancy = [white, black, white | black]
+
+    def toggle_move_bits(self, move):
+        # every update is an xor, so applying it a second time undoes the move
+        pieces = self.pieces
+        code = move.code
+        start = code & 0x3F
+        end = (code >> 6) & 0x3F
+        moved = (code >> 12) & 0xF
+        captured = (code >> 16) & 0xF
+        start_bit = 1 << start
+        end_bit = 1 << end
+        pieces[moved] ^= start_bit
+
+        if code & Move.ENPASSANT_FLAG:
+            pieces[captured] ^= 1 << ((start & ~0x7) | (end & 0x7))
+        elif captured != EMPTY:
+            pieces[captured] ^= end_bit
+
+        if code & Move.PROMOTION_FLAG:
+            pieces[PIECE_INDEX[move.piece_moved[0] + move.promotion_choice]] ^= end_bit
+        else:
+            pieces[moved] ^= end_bit
+
+        if code & Move.CASTLE_FLAG:
+            rook = moved - KING + ROOK
+            row_offset = end & ~0x7
+            if end > start:  # kingside castle
+                pieces[rook] ^= (1 << (row_offset + 7)) | (1 << (row_offset + 5))
+            else:  # queenside castle
+                pieces[rook] ^= (1 << row_offset) | (1 << (row_offset + 3))
+
+        self.update_occupancy()
+
+    def make_move(self, move, promotion_choice=None):
+        super().make_move(move, promotion_choice)
+        self.toggle_move_bits(move)
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            last_move = self.move_log[-1]
+            super().undo_move()
+            self.toggle_move_bits(last_move)
+
+    def attackers_to(self, square, occupied, color):
+        # pieces of the given color attacking the square
+        offset = 0 if color == WHITE else 6
+        pieces = self.pieces
+        rooks_queens = pieces[offset + ROOK] | pieces[offset + QUEEN]
+        bishops_queens = pieces[offset + BISHOP] | pieces[offset + QUEEN]
+        return (
+            (KNIGHT_ATTACKS[square] & pieces[offset + KNIGHT]) |
+            (KING_ATTACKS[square] & pieces[offset + KING]) |
+            (PAWN_ATTACKS[1 - color][square] & pieces[offset + PAWN]) |
+            (rook_attacks(square, occupied) & rooks_queens if rooks_queens else 0) |
+            (bishop_attacks(square, occupied) & bishops_queens if bishops_queens else 0)
+        )
+
+    def is_square_attacked(self, square, color):
+        return self.attackers_to(square, self.occupancy[2], color) != 0
+
+    def king_square(self, color):
+        return self.pieces[KING if color == WHITE else KING + 6].bit_length() - 1
+
+    def is_in_check(self):
+        us = WHITE if self.white_to_move else BLACK
+        return self.is_square_attacked(self.king_square(us), 1 - us)
+
+    def get_pin_masks(self, king_square, us, them):
+        # maps pinned square -> squares that piece may still move to
+        pin_masks = {}
+        offset = 0 if them == WHITE else 6
+        enemy_rooks = self.pieces[offset + ROOK] | self.pieces[offset + QUEEN]
+        enemy_bishops = self.pieces[offset + BISHOP] | self.pieces[offset + QUEEN]
+        occupied = self.occupancy[2]
+        own = self.occupancy[us]
+
+        for direction in DIRECTIONS:
+            sliders = enemy_rooks if direction in ORTHOGONAL_DIRECTIONS else enemy_bishops
+            ray = RAYS[direction][king_square]
+            if not ray & sliders:
+                continue
+            blockers = ray & occupied
+            squares = list(iterate_bits(blockers))
+            if not direction[2]:
+                squares.reverse()  # order blockers outward from the king
+            if len(squares) >= 2 and (own >> squares[0]) & 1 and (sliders >> squares[1]) & 1:
+                pin_masks[squares[0]] = BETWEEN[king_square][squares[1]] | (1 << squares[1])
+        return pin_masks
+
+    def captured_piece(self, square, offset):
+        # index of the enemy piece on the square, offset picks the enemy color
+        pieces = self.pieces
+        for piece in range(offset, offset + 6):
+            if (pieces[piece] >> square) & 1:
+                return piece
+        return EMPTY
+
+    def get_all_legal_moves(self, captures_only=False):
+        # captures_only limits the output to captures and promotions, for quiescence search
+        us = WHITE if self.white_to_move else BLACK
+        them = 1 - us
+        offset = 0 if us == WHITE else 6
+        enemy_offset = 6 - offset
+        pieces = self.pieces
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = self.occupancy[2]
+        from_code = Move.from_code
+        encode = Move.encode
+        captured_piece = self.captured_piece
+        moves = []
+
+        king_square = self.king_square(us)
+        checkers = self.attackers_to(king_square, occupied, them)
+        self.in_check = checkers != 0
+
+        # king moves, checked against the board with the king lifted off
+        occupied_without_king = occupied ^ (1 << king_square)
+        king_code = king_square | (offset + KING) << 12
+        for end in iterate_bits(KING_ATTACKS[king_square] & enemy):
+            if not self.attackers_to(end, occupied_without_king, them):
+                moves.append(from_code(king_code | end << 6 | captured_piece(end, enemy_offset) << 16))
+        if not captures_only:
+            for end in iterate_bits(KING_ATTACKS[king_square] & ~occupied):
+                if not self.attackers_to(end, occupied_without_king, them):
+                    moves.append(from_code(king_code | end << 6 | EMPTY << 16))
+
+        if checkers & (checkers - 1):  # double check, only the king can move
+            return moves
+
+        if checkers:
+            checker_square = checkers.bit_length() - 1
+            targets = BETWEEN[king_square][checker_square] | checkers
+        else:
+            targets = ~0
+            if not captures_only:
+                self.get_bitboard_castle_moves(king_square, us, them, moves)
+
+        pin_masks = self.get_pin_masks(king_square, us, them)
+
+        # pawns
+        pawn = offset + PAWN
+        forward = -8 if us == WHITE else 8
+        double_push_row = 6 if us == WHITE else 1
+        promotion_row = 0 if us == WHITE else 7
+        for start in iterate_bits(pieces[pawn]):
+            allowed = targets & pin_masks.get(start, ~0)
+            end = start + forward
+            if not (occupied >> end) & 1 and (not captures_only or end >> 3 == promotion_row):
+                if (allowed >> end) & 1:
+                    moves.append(from_code(encode(start, end, pawn)))
+                double_end = end + forward
+                if start >> 3 == double_push_row and not captures_only and not (occupied >> double_end) & 1 and (allowed >> double_end) & 1:
+                    moves.append(from_code(encode(start, double_end, pawn)))
+            for end in iterate_bits(PAWN_ATTACKS[us][start] & enemy & allowed):
+                moves.append(from_code(encode(start, end, pawn, captured_piece(end, enemy_offset))))
+
+            if self.enpassant_possible:
+                enpassant_square = self.enpassant_possible[0] * 8 + self.enpassant_possible[1]
+                if (PAWN_ATTACKS[us][start] >> enpassant_square) & 1:
+                    captured_square = enpassant_square - forward
+                    # replay the capture on the occupancy and make sure nothing hits the king
+                    occupied_after = (occupied ^ (1 << start) ^ (1 << captured_square)) | (1 << enpassant_square)
+                    enemy_after = enemy ^ (1 << captured_square)
+                    if not self.attackers_to(king_square, occupied_after, them) & enemy_after:
+                        moves.append(from_code(encode(start, enpassant_square, pawn, enemy_offset + PAWN, is_enpassant_move=True)))
+
+        # knights, pinned knights can never move
+        for start in iterate_bits(pieces[offset + KNIGHT]):
+            if start in pin_masks:
+                continue
+            start_code = start | (offset + KNIGHT) << 12
+            reachable = KNIGHT_ATTACKS[start] & targets
+            for end in iterate_bits(reachable & enemy):
+                moves.append(from_code(start_code | end << 6 | captured_piece(end, enemy_offset) << 16))
+            if not captures_only:
+                for end in iterate_bits(reachable & ~occupied):
+                    moves.append(from_code(start_code | end << 6 | EMPTY << 16))
+
+        # sliders
+        for piece, attacks in ((ROOK, rook_attacks), (BISHOP, bishop_attacks), (QUEEN, None)):
+            for start in iterate_bits(pieces[offset + piece]):
+                if attacks is None:
+                    reachable = rook_attacks(start, occupied) | bishop_attacks(start, occupied)
+                else:
+                    reachable = attacks(start, occupied)
+                reachable &= targets & pin_masks.get(start, ~0)
+                start_code = start | (offset + piece) << 12
+                for end in iterate_bits(reachable & enemy):
+                    moves.append(from_code(start_code | end << 6 | captured_piece(end, enemy_offset) << 16))
+                if not captures_only:
+                    for end in iterate_bits(reachable & ~occupied):
+                        moves.append(from_code(start_code | end << 6 | EMPTY << 16))
+
+        return moves
+
+    def get_bitboard_castle_moves(self, king_square, us, them, moves):
+        rights = self.current_castling_rights.mask
+        kingside = rights & (WHITE_KINGSIDE if us == WHITE else BLACK_KINGSIDE)
+        queenside = rights & (WHITE_QUEENSIDE if us == WHITE else BLACK_QUEENSIDE)
+        occupied = self.occupancy[2]
+        king = KING if us == WHITE else KING + 6
+
+        if kingside and not (occupied >> (king_square + 1)) & 1 and not (occupied >> (king_square + 2)) & 1:
+            if not self.is_square_attacked(king_square + 1, them) and not self.is_square_attacked(king_square + 2, them):
+                moves.append(Move.from_code(Move.encode(king_square, king_square + 2, king, is_castle_move=True)))
+
+        if queenside and not occupied & ((1 << (king_square - 1)) | (1 << (king_square - 2)) | (1 << (king_square - 3))):
+            if not self.is_square_attacked(king_square - 1, them) and not self.is_square_attacked(king_square - 2, them):
+                moves.append(Move.from_code(Move.encode(king_square, king_square - 2, king, is_castle_move=True)))
+
+    def get_valid_moves(self):
+        moves = self.get_all_legal_moves()
+
+        if len(moves) == 0:  # Either checkmate or stalemate
+            self.checkmate = self.in_check
+            self.stalemate = not self.in_check
+        else:
+            self.checkmate = False
+            self.stalemate = False
+
+        check_info = CheckInfo(self)
+        for move in moves:
+            move.check_info = check_info
+
+        return moves
+
+    def get_capture_moves(self):
+        moves = self.get_all_legal_moves(captures_only=True)
+        self.checkmate = False  # an empty capture list says nothing about mate
+        self.stalemate = False
+        return moves
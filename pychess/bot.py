@@ -1,62 +1,183 @@
 from pst import *
+import os
 import random
+import time
+from array import array
+from multiprocessing import shared_memory, resource_tracker, Array, Value
+from concurrent.futures import ProcessPoolExecutor, wait
+from worker import SearchWorker
+from engine import Move
+from tablebase import WIN, LOSS
 
-class ZobristHashing:
-    def __init__(self):
-        self.zobrist_table = self.init_zobrist()
-        self.transposition_table = {}
-
-    def init_zobrist(self):
-        zobrist_table = [[0 for _ in range(12)] for _ in range(64)]  # 64 squares × 12 piece types
-        for square in range(64):
-            for piece in range(12):
-                zobrist_table[square][piece] = hash((square, piece)) & ((1 << 64) - 1) # add piece bitstring
-        zobrist_table.append(hash("black_to_move") & ((1 << 64) - 1))  # add "black_to_move" bitstring
-        return zobrist_table
-
-    def compute_hash(self, board, is_black_to_move):
-        h = 0
-        if is_black_to_move:
-            h ^= self.zobrist_table[-1]  # XOR the "black to move" bitstring
-
-        for row in range(8):  # loop over rows
-            for col in range(8):  # loop over columns
-                piece = board[row, col]  # get the piece on this square
-                if piece != "..":  # if the square is not empty
-                    piece_index = self.get_piece_index(piece)  # map piece to its index
-                    square_index = row * 8 + col  # flatten row and column to a square index
-                    h ^= self.zobrist_table[square_index][piece_index]  # XOR the square/piece random value
-
-        return h
-
-    def get_piece_index(self, piece):
-        piece_map = {
-            "wP": 0, "wR": 1, "wN": 2, "wB": 3, "wQ": 4, "wK": 5,
-            "bP": 6, "bR": 7, "bN": 8, "bB": 9, "bQ": 10, "bK": 11
-        }
-        return piece_map.get(piece, -1)
+# fixed-size hash table of search results keyed by GameState.zobrist_key
+# entries are packed into two 64-bit words of a preallocated array, so memory stays at hash_mb however long the bot plays
+# the first word is the key xor'd with the data word, which verifies the key and turns a torn write into a miss
+# each bucket has a depth-preferred slot and an always-replace slot
+class TranspositionTable:
+    FLAGS = {"exact": 1, "lowerbound": 2, "upperbound": 3}
+    FLAG_NAMES = {v: k for k, v in FLAGS.items()}
+    ENTRY_BYTES = 16
+    SCORE_SCALE = 1000  # scores are floats, stored as fixed point
+    SCORE_OFFSET = 1 << 31
+    NO_MOVE = 0xFFFF
+
+    def __init__(self, hash_mb=64):
+        self.hash_mb = hash_mb
+        self.bucket_count = max(1, hash_mb * 1024 * 1024 // (2 * self.ENTRY_BYTES))
+        self.table = array("Q", bytes(self.bucket_count * 4 * 8))  # 2 slots per bucket, 2 words per slot
+        self.age = 0
+        self.reset_stats()
+
+    def __getstate__(self):
+        # the table itself never crosses a process boundary, the other side starts empty
+        state = self.__dict__.copy()
+        del state["table"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.table = array("Q", bytes(self.bucket_count * 4 * 8))
 
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        self.table = array("Q", bytes(self.bucket_count * 4 * 8))
+        self.age = 0
+        self.reset_stats()
+
+    def new_search(self):
+        # entries from older searches are the first to be replaced
+        self.age = (self.age + 1) & 0x3F
+
+    def pack(self, depth, value, flag, best_move_id):
+        score = int(round(value * self.SCORE_SCALE)) + self.SCORE_OFFSET
+        move = self.NO_MOVE if best_move_id is None else best_move_id
+        return score | move << 32 | (depth & 0xFF) << 48 | self.FLAGS[flag] << 56 | self.age << 58
+
+    def probe(self, zobrist_hash):
+        # returns (depth, value, flag, best_move_id) or None
+        self.probes += 1
+        table = self.table
+        index = (zobrist_hash % self.bucket_count) * 4
+        for slot in (index, index + 2):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == zobrist_hash:
+                self.hits += 1
+                move = (data >> 32) & 0xFFFF
+                return (
+                    (data >> 48) & 0xFF,
+                    ((data & 0xFFFFFFFF) - self.SCORE_OFFSET) / self.SCORE_SCALE,
+                    self.FLAG_NAMES[(data >> 56) & 0x3],
+                    None if move == self.NO_MOVE else move
+                )
+        if table[index + 1] or table[index + 3]:
+            self.collisions += 1  # bucket is in use by other positions
+        return None
 
     def lookup_transposition_table(self, zobrist_hash, depth, alpha, beta):
-        entry = self.transposition_table.get(zobrist_hash)
-        if entry and entry['depth'] >= depth:
-            if entry['flag'] == 'exact':
-                return entry['value']
-            elif entry['flag'] == 'lowerbound' and entry['value'] > alpha:
-                alpha = entry['value']
-            elif entry['flag'] == 'upperbound' and entry['value'] < beta:
-                beta = entry['value']
+        entry = self.probe(zobrist_hash)
+        if entry and entry[0] >= depth:
+            _, value, flag, _ = entry
+            if flag == "exact":
+                return value
+            elif flag == "lowerbound" and value > alpha:
+                alpha = value
+            elif flag == "upperbound" and value < beta:
+                beta = value
             if alpha >= beta:
-                return entry['value']
+                return value
         return None
 
-    def store_in_transposition_table(self, zobrist_hash, depth, value, flag):
-        self.transposition_table[zobrist_hash] = {
-            'depth': depth,
-            'value': value,
-            'flag': flag
+    def get_best_move_id(self, zobrist_hash):
+        entry = self.probe(zobrist_hash)
+        return entry[3] if entry else None
+
+    def store_in_transposition_table(self, zobrist_hash, depth, value, flag, best_move_id=None):
+        self.stores += 1
+        table = self.table
+        index = (zobrist_hash % self.bucket_count) * 4
+        data = self.pack(depth, value, flag, best_move_id)
+
+        # depth-preferred slot: same position, deeper result, or stale entry
+        stored = table[index + 1]
+        if not stored or table[index] ^ stored == zobrist_hash or depth >= (stored >> 48) & 0xFF or (stored >> 58) != self.age:
+            table[index] = zobrist_hash ^ data
+            table[index + 1] = data
+        else:
+            table[index + 2] = zobrist_hash ^ data
+            table[index + 3] = data
+
+    def fill_rate(self, sample_buckets=1000):
+        # share of slots written during the current search, sampled from the start of the table
+        sample = min(sample_buckets, self.bucket_count)
+        filled = 0
+        for slot in range(0, sample * 4, 2):
+            data = self.table[slot + 1]
+            if data and (data >> 58) == self.age:
+                filled += 1
+        return filled / (sample * 2)
+
+    def get_stats(self):
+        return {
+            "probes": self.probes,
+            "hits": self.hits,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit rate": self.hits / self.probes if self.probes else 0,
+            "fill rate": self.fill_rate()
         }
 
+# the same table in a multiprocessing.shared_memory block, so the lazy smp helper processes all read and write one table
+# there are no locks, a write racing another process fails the key xor check on the next probe and reads as a miss
+# the age lives in the word after the last bucket, only the main thread starts a new search and the helpers store with its age
+class SharedTranspositionTable(TranspositionTable):
+    def __init__(self, hash_mb=64):
+        self.hash_mb = hash_mb
+        self.bucket_count = max(1, hash_mb * 1024 * 1024 // (2 * self.ENTRY_BYTES))
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=(self.bucket_count * 4 + 1) * 8)
+        self.table = self.shared_memory.buf.cast("Q")
+        self.owner_pid = os.getpid() # forked helpers inherit this object, only the creating process unlinks
+        self.age = 0
+        self.reset_stats()
+
+    def __getstate__(self):
+        # pickled for spawned processes, which attach to the block by name
+        state = self.__dict__.copy()
+        del state["table"]
+        del state["shared_memory"]
+        state["name"] = self.shared_memory.name
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop("name")
+        self.__dict__.update(state)
+        self.shared_memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(self.shared_memory._name, "shared_memory") # only the owner unlinks the block
+        self.table = self.shared_memory.buf.cast("Q")
+
+    @property
+    def age(self):
+        return self.table[self.bucket_count * 4]
+
+    @age.setter
+    def age(self, value):
+        self.table[self.bucket_count * 4] = value
+
+    def clear(self):
+        self.shared_memory.buf[:] = bytes(len(self.shared_memory.buf))
+        self.age = 0
+        self.reset_stats()
+
+    def close(self):
+        self.table.release()
+        self.shared_memory.close()
+        if os.getpid() == self.owner_pid:
+            self.shared_memory.unlink()
+
 class RandomBot:
     def __init__(self): 
         pass
@@ -89,7 +210,7 @@ class GreedyBot:
         best_player_move = None
         random.shuffle(valid_moves)
         for player_move in valid_moves:
-            game_state.make_move(player_move, is_ai_move=True)
+            game_state.make_move(player_move, promotion_choice="Q" if player_move.is_pawn_promotion else None)
             opponent_moves = game_state.get_valid_moves()
             if game_state.stalemate:
                 opponent_max_score = self.STALEMATE_SCORE
@@ -100,7 +221,7 @@ class GreedyBot:
             else:
                 opponent_max_score = -self.CHECKMATE_SCORE
                 for opponent_move in opponent_moves:
-                    game_state.make_move(opponent_move, is_ai_move=True)
+                    game_state.make_move(opponent_move, promotion_choice="Q" if opponent_move.is_pawn_promotion else None)
                     game_state.get_valid_moves()
                     if game_state.checkmate:
                         score = self.CHECKMATE_SCORE
@@ -164,7 +285,7 @@ class MinimaxBot:
         if maximizing:
             max_score = -self.CHECKMATE_SCORE
             for move in valid_moves:
-                game_state.make_move(move, is_ai_move=True)
+                game_state.make_move(move, promotion_choice="Q" if move.is_pawn_promotion else None)
                 next_moves = game_state.get_valid_moves()
                 score = self.minimax(game_state, next_moves, depth - 1, False)
                 if score > max_score:
@@ -178,7 +299,7 @@ class MinimaxBot:
         else: # minimizing
             min_score = self.CHECKMATE_SCORE
             for move in valid_moves:
-                game_state.make_move(move)
+                game_state.make_move(move, promotion_choice="Q" if move.is_pawn_promotion else None)
                 next_moves = game_state.get_valid_moves()
                 score = self.minimax(game_state, next_moves, depth - 1, True)
                 if score < min_score:
@@ -189,66 +310,196 @@ class MinimaxBot:
             
             return min_score
 
+class SearchTimeout(Exception):
+    pass
+
+# root split search, the root moves are dealt out to a persistent process pool and searched in parallel
+# each pool process keeps its own bot and transposition table, the best root score so far is shared through root_alpha
+root_worker_bot = None
+
+def init_root_worker(hash_mb, use_quiescence, root_alpha, root_stop, tablebases):
+    global root_worker_bot
+    root_worker_bot = NegamaxBot(hash_mb=hash_mb, use_quiescence=use_quiescence, tablebases=tablebases)
+    root_worker_bot.verbose = False
+    root_worker_bot.root_alpha = root_alpha
+    root_worker_bot.shared_stop = root_stop
+
+def search_root_moves(game_state, move_codes, depth, time_left, can_abort, new_search):
+    return root_worker_bot.search_root_moves(game_state, move_codes, depth, time_left, can_abort, new_search)
+
 class NegamaxBot:
-    def __init__(self):
-        # psts
-        self.white_pawn_pst = white_pawn_pst
-        self.black_pawn_pst = black_pawn_pst
-        self.white_knight_pst = white_knight_pst
-        self.black_knight_pst = black_knight_pst
-        self.white_bishop_pst = white_bishop_pst
-        self.black_bishop_pst = black_bishop_pst
-        self.white_rook_pst = white_rook_pst
-        self.black_rook_pst = black_rook_pst
-        self.white_queen_pst = white_queen_pst
-        self.black_queen_pst = black_queen_pst
+    MAX_SEARCH_DEPTH = 64
+    MOVE_OVERHEAD = 50 # milliseconds kept back for passing the move on
+    MOVES_TO_GO = 30 # assume the remaining clock has to last this many more moves
+    TABLEBASE_WIN_SCORE = 500 # a tablebase win scores this minus the plies to mate, below a mate on the board
+    DRAW_SCORE = 0 # every draw, stalemate, repetition, fifty moves, insufficient material or a tablebase draw
+    NULL_WINDOW = 0.01 # width of the zero window searches in pvs, scores are in pawns
+    ASPIRATION_WINDOW = 0.25 # root window around the last iteration's score, widened on a fail low or high
 
+    def __init__(self, hash_mb=64, use_quiescence=True, movetime=None, threads=1, root_split=False, book=None, tablebases=None):
         self.max_depth = 3
-        self.piece_score = {"K": 1000, "Q": 9, "R": 5, "B": 3.1, "N": 2.9, "P": 1}
-        self.pst_mapping = {
-            "wP": self.white_pawn_pst, 
-            "bP": self.black_pawn_pst, 
-            "wN": self.white_knight_pst, 
-            "bN": self.black_knight_pst, 
-            "wB": self.white_bishop_pst, 
-            "bB": self.black_bishop_pst, 
-            "wR": self.white_rook_pst, 
-            "bR": self.black_rook_pst, 
-            "wQ": self.white_queen_pst, 
-            "bQ": self.black_queen_pst
-        }
+        self.piece_score = {"K": 1000, "Q": 9, "R": 5, "B": 3.1, "N": 2.9, "P": 1} # for move ordering, the evaluation uses the tapered tables from pst.py
         self.next_move = None
         self.branch_counter = 0
-        self.zobrist_hashing = ZobristHashing()
+        self.transposition_table = TranspositionTable(hash_mb)
         self.CHECKMATE_SCORE = 1000
 
-    def score_board(self, game_state):
+        # quiescence search keeps following captures past the depth limit so a leaf is never scored mid exchange
+        self.use_quiescence = use_quiescence
+        self.qnode_counter = 0
+        self.next_poll = 0 # node count at which check_deadline next looks at the clock
+        self.DELTA_MARGIN = 2 # skip captures that cannot lift the score to alpha even with this much positional gain
+
+        # move ordering memory, killer_moves holds the last two quiet moves (move ids) that caused a beta cutoff at each ply from the root,
+        # history[color][start][end] adds up depth * depth for every quiet cutoff and is halved at the start of each search so it stays warm between moves
+        self.killer_moves = [[None, None] for _ in range(self.MAX_SEARCH_DEPTH + 1)]
+        self.history = np.zeros((2, 64, 64), dtype=np.int32)
+        self.root_ply = 0 # length of the move log at the root, plies from the root index killer_moves
+
+        # principal variation, pv_table[ply] is the best line found from the node at that ply, built up from the one below it
+        self.pv_table = [[] for _ in range(self.MAX_SEARCH_DEPTH + 2)]
+        self.principal_variation = [] # the pv of the last completed iteration, starting with the move find_best_move returns
+
+        # iterative deepening, with movetime (milliseconds) the search runs until the deadline instead of stopping at max_depth
+        self.movetime = movetime
+        self.search_depth = self.max_depth
+        self.deadline = None
+        self.can_abort = False
+        self.stop_requested = False # set from another thread to end the search early, e.g. on a uci stop
+
+        # on_iteration(depth, score, nodes, elapsed, pv) replaces the progress print after each iteration
+        self.on_iteration = None
+        self.verbose = True
+        self.completed_depth = 0
+        self.best_score = 0
+        self.search_nodes = 0
+
+        # lazy smp, threads - 1 helper processes search the same root and share the transposition table
+        self.threads = threads
+        self.helpers = [] # SearchWorker per helper, started on the first search
+        self.thread_index = 0
+        self.depth_offset = 0 # odd helpers start a ply deeper so the threads spread over depths
+        self.node_counts = None # shared per thread node counters, for nps over all threads
+
+        # root split, with threads > 1 the root moves go to a process pool instead of lazy smp helpers
+        self.root_split = root_split
+        self.root_pool = None
+        self.root_alpha = None
+        self.root_stop = None
+        self.shared_stop = None # root_stop as seen from a pool process
+
+        # opening book (book.OpeningBook), positions it knows are played from it without searching
+        self.book = book
+
+        # endgame tablebases (tablebase.Tablebases), probed at the root to pick the move and inside the search as exact scores
+        self.tablebases = tablebases
+
+    def terminal_score(self, game_state):
+        # score of a finished game, None while it is still going
         if game_state.checkmate:
             return -self.CHECKMATE_SCORE if game_state.white_to_move else self.CHECKMATE_SCORE
 
         elif game_state.stalemate or game_state.check_for_insufficient_material() or game_state.check_for_threefold_repetition() or game_state.check_for_fifty_move_rule():
-            return -self.CHECKMATE_SCORE if game_state.white_to_move else self.CHECKMATE_SCORE # discourage draws
+            return self.DRAW_SCORE # the same score the repetition and tablebase checks give inside the search
 
-        score = 0
+        return None
 
-        for row in range(game_state.board.shape[0]):
-            for column in range(game_state.board.shape[1]):
-                square = game_state.board[row, column]
-                if square != "..":
-                    piece = square[1]
-                    if piece != "K":
-                        piece_position_score = self.pst_mapping[square][row, column]
-                        
-                        if square[0] == "w":  # White piece
-                            score += self.piece_score[piece] + piece_position_score * 0.35
-                        elif square[0] == "b":  # Black piece
-                            score -= self.piece_score[piece] + piece_position_score * 0.35
-        return score
+    def score_board(self, game_state):
+        score = self.terminal_score(game_state)
+        if score is not None:
+            return score
+        return game_state.eval_score # tapered material and pst, kept up to date by make_move/undo_move
+
+    def tablebase_score(self, game_state):
+        # exact score from the side to move, None if the position isn't in the tablebases
+        probe = self.tablebases.probe(game_state)
+        if probe is None:
+            return None
+        wdl, dtm = probe
+        if wdl == WIN:
+            return self.TABLEBASE_WIN_SCORE - dtm
+        if wdl == LOSS:
+            return dtm - self.TABLEBASE_WIN_SCORE
+        return self.DRAW_SCORE
+
+    def find_tablebase_move(self, game_state, valid_moves):
+        # the move keeping the best tablebase result, the quickest mate when winning and the slowest when losing
+        # None unless the position and every position it leads to are in the tablebases
+        if self.tablebase_score(game_state) is None:
+            return None
+        best_move = None
+        best_score = None
+        best_promotion = None
+        for move in valid_moves:
+            for promotion_choice in ("Q", "R", "B", "N") if move.is_pawn_promotion else (None,):
+                game_state.make_move(move, promotion_choice=promotion_choice)
+                score = self.tablebase_score(game_state) # mated positions are in the tables too
+                game_state.undo_move()
+                if score is None:
+                    return None
+                if best_score is None or -score > best_score:
+                    best_move, best_score, best_promotion = move, -score, promotion_choice
+        if best_promotion is not None:
+            best_move.promotion_choice = best_promotion # make_move left the last choice tried on the move
+        self.best_score = best_score
+        return best_move
+
+    def score_boards(self, game_states):
+        # batched score_board from scratch, the positions still going are evaluated in one numpy call
+        # for scoring positions that weren't reached through make_move, e.g. offline analysis
+        scores = [self.terminal_score(game_state) for game_state in game_states]
+        running = [index for index, score in enumerate(scores) if score is None]
+        if running:
+            evaluations = evaluate_batch(np.array([game_states[index].piece_codes for index in running]))
+            for index, evaluation in zip(running, evaluations):
+                scores[index] = float(evaluation)
+        return scores
+
+    def search_frontier(self, game_state, valid_moves, alpha, beta, turn_multiplier, is_root):
+        # depth 1 without quiescence, every child is a leaf so it is scored in place without a recursive call,
+        # with the same repetition and tablebase checks negamax_alpha_beta_pruning makes on entry
+        board_hash = game_state.zobrist_key
+        max_score = -self.CHECKMATE_SCORE
+        best_move = None
+        for move in valid_moves:
+            if move.is_pawn_promotion:
+                move.promotion_choice = self.find_best_promotion_piece(game_state, move)
+            game_state.make_move(move, promotion_choice=move.promotion_choice)
+            self.branch_counter += 1
+            self.check_deadline()
+            score = self.DRAW_SCORE if game_state.is_repetition() else None
+            if score is None and self.tablebases is not None:
+                tablebase_score = self.tablebase_score(game_state)
+                if tablebase_score is not None:
+                    score = -tablebase_score # from the child's side
+            if score is None:
+                game_state.get_valid_moves() # sets checkmate and stalemate
+                score = turn_multiplier * self.score_board(game_state)
+            game_state.undo_move()
+            if score > max_score:
+                max_score = score
+                best_move = move
+        if is_root and best_move is not None:
+            self.next_move = best_move
+        if best_move is not None and max_score > alpha:
+            self.pv_table[len(game_state.move_log) - self.root_ply] = [best_move]
 
-    def order_moves(self, valid_moves):
+        if max_score >= beta:
+            flag = "lowerbound"
+        elif max_score <= alpha:
+            flag = "upperbound"
+        else:
+            flag = "exact"
+        self.transposition_table.store_in_transposition_table(board_hash, 1, max_score, flag, best_move.move_id if best_move else None)
+        return max_score
+
+    def order_moves(self, valid_moves, hash_move_id=None):
         def move_score(move):
             score = 0
 
+            if move.move_id == hash_move_id:
+                return 1000 # best move from the previous iteration or transposition table goes first
+
             if move.is_check:
                 score += 10
 
@@ -270,11 +521,378 @@ class NegamaxBot:
 
         valid_moves.sort(key=move_score, reverse=True)
 
-    def find_best_move(self, game_state, valid_moves, return_queue):
+    def pick_moves(self, game_state, valid_moves, hash_move_id, ply):
+        # staged move ordering, yields the hash move, captures that don't lose material, the killers, the quiet moves by history,
+        # and the losing captures last, a stage is only sorted once the moves before it failed to cut off
+        hash_move = None
+        captures = []
+        quiets = []
+        for move in valid_moves:
+            if move.move_id == hash_move_id:
+                hash_move = move
+            elif move.is_capture or move.is_pawn_promotion:
+                captures.append(move)
+            else:
+                quiets.append(move)
+        if hash_move is not None:
+            yield hash_move
+
+        self.order_captures(captures)
+        losing_captures = []
+        for move in captures:
+            attacker = move.piece_moved[1]
+            if move.is_pawn_promotion or attacker == "K" or self.piece_score[move.piece_captured[1]] >= self.piece_score[attacker]:
+                yield move # the king only takes what isn't defended
+            else:
+                losing_captures.append(move)
+
+        for killer_id in self.killer_moves[ply]:
+            for index, move in enumerate(quiets):
+                if move.move_id == killer_id:
+                    yield quiets.pop(index)
+                    break
+
+        history = self.history[0 if game_state.white_to_move else 1]
+        def quiet_score(move):
+            # the static bonuses only break ties, e.g. while the history is still cold
+            bonus = 15 if move.is_castle_move else 10 if move.is_check else -3 if move.piece_moved[1] == "P" else 0
+            return (history[move.code & 0x3F, (move.code >> 6) & 0x3F], bonus)
+
+        quiets.sort(key=quiet_score, reverse=True)
+        yield from quiets
+        yield from losing_captures
+
+    def record_cutoff(self, move, ply, depth, white_to_move):
+        # a quiet move refuted the move before it, try it early at this ply from now on and anywhere it comes up again
+        killers = self.killer_moves[ply]
+        if killers[0] != move.move_id:
+            killers[1] = killers[0]
+            killers[0] = move.move_id
+        self.history[0 if white_to_move else 1, move.code & 0x3F, (move.code >> 6) & 0x3F] += depth * depth
+
+    def age_move_ordering(self):
+        # killers are relative to a root that has moved on, the history just counts for less than what the new search finds
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = None
+        self.history >>= 1
+
+    def new_game(self):
+        # forgets the tables and move ordering built up over the last game, so a search doesn't depend on the games played before it
+        if self.thread_index == 0:
+            self.transposition_table.clear() # helpers share the main thread's table
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = None
+        self.history.fill(0)
+        self.next_move = None
+        self.principal_variation = []
+        self.best_score = 0
+        for helper in self.helpers:
+            helper.new_game()
+        if self.root_pool is not None:
+            self.stop_helpers() # the pool processes keep their own tables, start_helpers brings up fresh ones
+
+    def allocate_time(self, white_to_move, movetime=None, wtime=None, btime=None, increment=0):
+        # seconds to spend on this move, None searches to max_depth
+        if movetime is None and (wtime is None or btime is None):
+            movetime = self.movetime
+        if movetime is not None:
+            return max(movetime - self.MOVE_OVERHEAD, 1) / 1000
+
+        remaining = wtime if white_to_move else btime
+        if remaining is None:
+            return None
+        budget = remaining / self.MOVES_TO_GO + increment * 0.75
+        budget = min(budget, remaining / 2) - self.MOVE_OVERHEAD # never bet half the clock on one move
+        return max(budget, 1) / 1000
+
+    def check_deadline(self):
+        # looks at the clock every 256 nodes, raising unwinds the whole search back to find_best_move
+        # a threshold rather than a multiple of 256, the counters can step past one between two calls
+        nodes = self.branch_counter + self.qnode_counter
+        if nodes >= self.next_poll:
+            self.next_poll = nodes + 256
+            if self.node_counts is not None:
+                self.node_counts[self.thread_index] = nodes
+            if self.can_abort and (self.stop_requested or (self.shared_stop is not None and self.shared_stop.value) or (self.deadline is not None and time.perf_counter() >= self.deadline)):
+                raise SearchTimeout()
+
+    def start_helpers(self):
+        if self.root_split:
+            if self.root_pool is None and self.threads > 1:
+                self.start_root_pool()
+            return
+        if len(self.helpers) == self.threads - 1:
+            return
+        self.stop_helpers()
+        if not isinstance(self.transposition_table, SharedTranspositionTable):
+            self.transposition_table = SharedTranspositionTable(self.transposition_table.hash_mb)
+        self.node_counts = Array("q", self.threads, lock=False)
+        for index in range(1, self.threads):
+            helper = NegamaxBot(hash_mb=0, use_quiescence=self.use_quiescence, tablebases=self.tablebases) # hash_mb=0, the shared table replaces its own
+            helper.transposition_table = self.transposition_table
+            helper.verbose = False
+            helper.thread_index = index
+            helper.depth_offset = index % 2
+            helper.node_counts = self.node_counts
+            self.helpers.append(SearchWorker(helper))
+
+    def stop_helpers(self):
+        for helper in self.helpers:
+            helper.close()
+        self.helpers = []
+        self.node_counts = None
+        if self.root_pool is not None:
+            self.root_pool.shutdown(cancel_futures=True)
+            self.root_pool = None
+
+    def start_root_pool(self):
+        self.root_alpha = Value("d", -self.CHECKMATE_SCORE)
+        self.root_stop = Value("b", 0, lock=False)
+        self.root_pool = ProcessPoolExecutor(max_workers=self.threads, initializer=init_root_worker, initargs=(self.transposition_table.hash_mb, self.use_quiescence, self.root_alpha, self.root_stop, self.tablebases))
+        self.root_pool.submit(int).result() # starts the processes now, from the calling thread
+
+    def search_root_split(self, game_state, valid_moves, depth):
+        # one iteration of the root split search, raises SearchTimeout if any chunk was cut short
+        # there is no aspiration window here, the chunks already narrow their windows through the shared root_alpha
+        self.order_moves(valid_moves, self.next_move.move_id if self.next_move is not None else None)
+        self.root_alpha.value = -self.CHECKMATE_SCORE
+        self.root_stop.value = 0
+        time_left = None if self.deadline is None else self.deadline - time.perf_counter()
+
+        # dealt round robin so every process gets some of the moves ordered first
+        chunks = [valid_moves[index::self.threads] for index in range(self.threads)]
+        futures = [self.root_pool.submit(search_root_moves, game_state, [move.code for move in chunk], depth, time_left, self.can_abort, depth == 1) for chunk in chunks if chunk]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=0.05)
+            if self.can_abort and (self.stop_requested or (self.deadline is not None and time.perf_counter() >= self.deadline)):
+                self.root_stop.value = 1
+
+        scores = {}
+        exact_scores = {}
+        promotion_choices = {}
+        pvs = {}
+        complete = True
+        for future in futures:
+            results, finished, nodes = future.result()
+            self.branch_counter += nodes
+            complete = complete and finished
+            for move_id, score, exact, promotion_choice, pv in results:
+                scores[move_id] = score
+                if exact:
+                    exact_scores[move_id] = score
+                promotion_choices[move_id] = promotion_choice
+                pvs[move_id] = pv
+        if not complete:
+            raise SearchTimeout()
+
+        # a move that failed low only has an upper bound, which can equal the score of the move that set root_alpha,
+        # so the best move is picked from the exact scores, there is none only when every move is mated
+        if exact_scores:
+            scores = exact_scores
+        best_move = max((move for move in valid_moves if move.move_id in scores), key=lambda move: scores[move.move_id]) # ties go to the move ordered first
+        if best_move.is_pawn_promotion:
+            best_move.promotion_choice = promotion_choices[best_move.move_id]
+        self.next_move = best_move
+        self.pv_table[0] = [best_move] + pvs[best_move.move_id]
+        return scores[best_move.move_id]
+
+    def search_root_moves(self, game_state, move_codes, depth, time_left, can_abort, new_search):
+        # runs in a pool process, searches its share of the root moves against the shared best score
+        # each result is (move_id, score, exact, promotion_choice, pv), a score at or below the alpha it was searched with is only an upper bound
+        if new_search:
+            self.transposition_table.new_search()
+            self.age_move_ordering()
+        self.root_ply = len(game_state.move_log)
+        self.branch_counter = 0
+        self.qnode_counter = 0
+        self.next_poll = 0
+        self.search_depth = depth
+        self.deadline = None if time_left is None else time.perf_counter() + time_left
+        self.can_abort = can_abort
+        turn_multiplier = 1 if game_state.white_to_move else -1
+        root_log_length = len(game_state.move_log)
+
+        results = []
+        try:
+            for code in move_codes:
+                move = Move.from_code(code)
+                if move.is_pawn_promotion:
+                    move.promotion_choice = self.find_best_promotion_piece(game_state, move)
+                alpha = self.root_alpha.value
+                game_state.make_move(move, promotion_choice=move.promotion_choice)
+                score = -self.negamax_alpha_beta_pruning(game_state, game_state.get_valid_moves(), depth - 1, -self.CHECKMATE_SCORE, -alpha, -turn_multiplier)
+                game_state.undo_move()
+                exact = score > alpha or alpha <= -self.CHECKMATE_SCORE
+                results.append((move.move_id, score, exact, move.promotion_choice, self.pv_table[1] if exact else []))
+                with self.root_alpha.get_lock():
+                    if score > self.root_alpha.value:
+                        self.root_alpha.value = score
+        except SearchTimeout:
+            while len(game_state.move_log) > root_log_length:
+                game_state.undo_move()
+            return results, False, self.branch_counter + self.qnode_counter
+        return results, True, self.branch_counter + self.qnode_counter
+
+    def close(self):
+        # releases the helper processes and the shared table, the bot can't search afterwards
+        self.stop_helpers()
+        if isinstance(self.transposition_table, SharedTranspositionTable):
+            self.transposition_table.close()
+
+    def set_threads(self, threads):
+        self.stop_helpers()
+        self.threads = max(1, threads)
+
+    def resize_hash(self, hash_mb):
+        self.stop_helpers()
+        if isinstance(self.transposition_table, SharedTranspositionTable):
+            self.transposition_table.close()
+        self.transposition_table = TranspositionTable(hash_mb)
+
+    def count_nodes(self):
+        # nodes searched so far by all threads
+        nodes = self.branch_counter + self.qnode_counter
+        if self.node_counts is not None:
+            nodes += sum(self.node_counts[1:])
+        return nodes
+
+    def search_root(self, game_state, valid_moves, depth):
+        # one iteration, in an aspiration window around the last iteration's score once there is one to go on,
+        # the side the score falls out of is widened, twice as far each time, and the root searched again
+        turn_multiplier = 1 if game_state.white_to_move else -1
+        window = self.ASPIRATION_WINDOW
+        alpha, beta = -self.CHECKMATE_SCORE, self.CHECKMATE_SCORE
+        if depth >= 3 and abs(self.best_score) < self.TABLEBASE_WIN_SCORE / 2: # mate and tablebase scores jump too far
+            alpha, beta = self.best_score - window, self.best_score + window
+        while True:
+            score = self.negamax_alpha_beta_pruning(game_state, valid_moves, depth, alpha, beta, turn_multiplier)
+            window *= 2
+            if score <= alpha and alpha > -self.CHECKMATE_SCORE:
+                alpha = max(score - window, -self.CHECKMATE_SCORE)
+            elif score >= beta and beta < self.CHECKMATE_SCORE:
+                beta = min(score + window, self.CHECKMATE_SCORE)
+            else:
+                return score
+
+    def find_best_move(self, game_state, valid_moves, return_queue=None, movetime=None, wtime=None, btime=None, increment=0, depth=None, infinite=False):
         # self.negamax(game_state, valid_moves, self.max_depth, 1 if game_state.white_to_move else -1)
-        self.negamax_alpha_beta_pruning(game_state, valid_moves, self.max_depth, -self.CHECKMATE_SCORE, self.CHECKMATE_SCORE, 1 if game_state.white_to_move else -1)
-        print(f"Branches Evaluated: {self.branch_counter}")
-        return_queue.put(self.next_move)
+        if self.thread_index == 0:
+            self.transposition_table.new_search() # helpers share the table and its age, they search in the main thread's generation
+        self.age_move_ordering()
+        self.root_ply = len(game_state.move_log)
+        self.branch_counter = 0
+        self.qnode_counter = 0
+        self.next_poll = 0
+        self.next_move = None
+        self.completed_depth = 0
+
+        if self.book is not None and self.thread_index == 0:
+            book_move = self.book.choose_move(game_state, valid_moves)
+            if book_move is not None:
+                self.best_score = 0
+                self.search_nodes = 0
+                self.next_move = book_move
+                self.principal_variation = [book_move]
+                if self.verbose:
+                    print(f"Book move: {book_move}")
+                if return_queue is not None:
+                    return_queue.put(book_move)
+                return book_move
+
+        if self.tablebases is not None and self.thread_index == 0:
+            tablebase_move = self.find_tablebase_move(game_state, valid_moves)
+            if tablebase_move is not None:
+                self.search_nodes = 0
+                self.next_move = tablebase_move
+                self.principal_variation = [tablebase_move]
+                if self.verbose:
+                    print(f"Tablebase move: {tablebase_move} score {self.best_score:.2f}")
+                if return_queue is not None:
+                    return_queue.put(tablebase_move)
+                return tablebase_move
+
+        if self.threads > 1:
+            # helpers search until this thread is done, their results only count if they got deeper
+            self.start_helpers()
+        if self.helpers:
+            for index in range(1, self.threads):
+                self.node_counts[index] = 0
+            for helper in self.helpers:
+                helper.start_search(game_state, infinite=True)
+
+        start_time = time.perf_counter()
+        time_budget = None if infinite else self.allocate_time(game_state.white_to_move, movetime, wtime, btime, increment)
+        if depth is not None:
+            max_depth = min(depth, self.MAX_SEARCH_DEPTH)
+        elif infinite or time_budget is not None:
+            max_depth = self.MAX_SEARCH_DEPTH
+        else:
+            max_depth = self.max_depth
+        if time_budget is not None and len(valid_moves) == 1:
+            max_depth = 1 # forced move, nothing to think about
+
+        root_log_length = len(game_state.move_log)
+        best_move = None
+        self.deadline = None if time_budget is None else start_time + time_budget
+        self.can_abort = self.thread_index > 0 # the first iteration always completes so there is a move to play, helpers don't need one
+        for search_depth in range(1 + self.depth_offset, max_depth + 1):
+            self.search_depth = search_depth
+            try:
+                if self.root_pool is not None:
+                    score = self.search_root_split(game_state, valid_moves, search_depth)
+                else:
+                    score = self.search_root(game_state, valid_moves, search_depth)
+            except SearchTimeout:
+                while len(game_state.move_log) > root_log_length:
+                    game_state.undo_move()
+                if self.verbose:
+                    print(f"Depth {search_depth} aborted")
+                break
+
+            best_move = self.next_move
+            pv = self.pv_table[0]
+            self.principal_variation = pv if pv and pv[0] is best_move else [best_move]
+            self.completed_depth = search_depth
+            self.best_score = score
+            elapsed = time.perf_counter() - start_time
+            nodes = self.count_nodes()
+            if self.on_iteration is not None:
+                self.on_iteration(search_depth, score, nodes, elapsed, self.principal_variation)
+            elif self.verbose:
+                print(f"Depth {search_depth}: {best_move} score {score:.2f} nodes {nodes} time {elapsed:.2f}s pv {' '.join(move.get_uci_notation() for move in self.principal_variation)}")
+
+            if self.stop_requested or (time_budget is not None and elapsed >= time_budget / 2):
+                break # the next iteration would not finish in time
+            self.can_abort = True
+        self.deadline = None
+        self.can_abort = False
+        self.search_nodes = self.branch_counter + self.qnode_counter
+
+        for helper in self.helpers:
+            helper.stop(wait=True)
+            self.search_nodes += helper.result_nodes
+            if helper.result is not None and helper.result_depth > self.completed_depth:
+                # the helper's move is a copy from another process, play the matching move from this position
+                best_move = next(move for move in valid_moves if move.move_id == helper.result.move_id)
+                if best_move.is_pawn_promotion:
+                    best_move.promotion_choice = helper.result.promotion_choice
+                self.completed_depth = helper.result_depth
+                self.best_score = helper.result_score
+                self.principal_variation = [best_move] + helper.result_pv[1:]
+        self.next_move = best_move
+
+        if self.verbose:
+            if self.helpers:
+                elapsed = time.perf_counter() - start_time
+                print(f"Threads: {self.threads}, depth {self.completed_depth}, nodes {self.search_nodes}, nps {self.search_nodes / elapsed if elapsed > 0 else 0:,.0f}")
+            print(f"Branches Evaluated: {self.branch_counter}")
+            if self.use_quiescence:
+                print(f"Quiescence Nodes: {self.qnode_counter}")
+            print("Transposition Table: " + ", ".join(f"{name} {value:.2f}" if isinstance(value, float) else f"{name} {value}" for name, value in self.transposition_table.get_stats().items()))
+        if return_queue is not None:
+            return_queue.put(self.next_move)
+        return self.next_move
 
     def negamax(self, game_state, valid_moves, depth, turn_multiplier):
         self.branch_counter += 1
@@ -286,11 +904,12 @@ class NegamaxBot:
 
         max_score = -self.CHECKMATE_SCORE
         for move in valid_moves:
-            game_state.make_move(move, is_ai_move=True)
+            game_state.make_move(move, promotion_choice="Q" if move.is_pawn_promotion else None)
             next_moves = game_state.get_valid_moves()
             score = -self.negamax(game_state, next_moves, depth - 1, -turn_multiplier)
             if score > max_score:
                 max_score = score
+                best_move = move
                 if depth == self.max_depth:
                     self.next_move = move
             game_state.undo_move()
@@ -314,28 +933,114 @@ class NegamaxBot:
 
         return promotion_piece
 
+    def order_captures(self, captures):
+        # mvv-lva: most valuable victim first, cheapest attacker breaks ties
+        def capture_score(move):
+            if move.is_pawn_promotion:
+                return 100 + self.piece_score.get(move.piece_captured[1], 0)
+            return self.piece_score.get(move.piece_captured[1], 0) * 10 - self.piece_score[move.piece_moved[1]]
+
+        captures.sort(key=capture_score, reverse=True)
+
+    def quiescence(self, game_state, alpha, beta, turn_multiplier):
+        self.qnode_counter += 1
+        self.check_deadline()
+
+        in_check = game_state.is_in_check() # decides which generator runs, so only one of them does
+        if in_check:
+            # no standing pat while in check, every evasion has to be searched
+            moves = game_state.get_valid_moves()
+            if not moves:
+                return turn_multiplier * self.score_board(game_state)
+            stand_pat = -self.CHECKMATE_SCORE
+        else:
+            moves = game_state.get_capture_moves()
+            stand_pat = turn_multiplier * self.score_board(game_state)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+
+        self.order_captures(moves)
+
+        max_score = stand_pat
+        for move in moves:
+            if not in_check and not move.is_pawn_promotion:
+                # delta pruning
+                if stand_pat + self.piece_score.get(move.piece_captured[1], 0) + self.DELTA_MARGIN < alpha:
+                    continue
+
+            game_state.make_move(move, promotion_choice="Q" if move.is_pawn_promotion else None)
+            score = -self.quiescence(game_state, -beta, -alpha, -turn_multiplier)
+            game_state.undo_move()
+
+            if score > max_score:
+                max_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        return max_score
+
     def negamax_alpha_beta_pruning(self, game_state, valid_moves, depth, alpha, beta, turn_multiplier):
         self.branch_counter += 1
+        self.check_deadline()
+        is_root = depth == self.search_depth
+        is_pv_node = beta - alpha > 2 * self.NULL_WINDOW # inside the full window, everything else is searched with a zero window
+        ply = len(game_state.move_log) - self.root_ply
+        self.pv_table[ply] = []
+
+        # a repeat can be played again and again, so it is scored as the draw right away
+        # before the transposition table, whose entries don't know the moves that led to a position
+        if not is_root and game_state.is_repetition():
+            return self.DRAW_SCORE
+
+        if self.tablebases is not None and not is_root:
+            tablebase_score = self.tablebase_score(game_state)
+            if tablebase_score is not None:
+                return tablebase_score
 
-        # compute zobrist hash for current board state
-        board_hash = self.zobrist_hashing.compute_hash(game_state.board, not game_state.white_to_move)
-        cached_score = self.zobrist_hashing.lookup_transposition_table(board_hash, depth, alpha, beta)
-        if cached_score is not None:
-            return cached_score # return cached value if found
+        if not valid_moves:
+            return turn_multiplier * self.score_board(game_state) # checkmate or stalemate, the move loop would score both as mate
 
-        if depth == 0: # TODO: add quiescence search mabye?
-            score =  turn_multiplier * self.score_board(game_state)
-            self.zobrist_hashing.store_in_transposition_table(board_hash, depth, score, "exact")
+        board_hash = game_state.zobrist_key
+        if not is_pv_node: # the root has to be searched to pick a move, and pv nodes to build the pv
+            cached_score = self.transposition_table.lookup_transposition_table(board_hash, depth, alpha, beta)
+            if cached_score is not None:
+                return cached_score # return cached value if found
+
+        if depth == 0:
+            if not self.use_quiescence:
+                score = turn_multiplier * self.score_board(game_state)
+                self.transposition_table.store_in_transposition_table(board_hash, depth, score, "exact")
+                return score
+
+            score = self.quiescence(game_state, alpha, beta, turn_multiplier)
+            if score >= beta:
+                flag = "lowerbound"
+            elif score <= alpha:
+                flag = "upperbound"
+            else:
+                flag = "exact"
+            self.transposition_table.store_in_transposition_table(board_hash, depth, score, flag)
             return score
+
+        if depth == 1 and not self.use_quiescence:
+            return self.search_frontier(game_state, valid_moves, alpha, beta, turn_multiplier, is_root)
         
-        self.order_moves(valid_moves)
+        if is_root and self.next_move is not None:
+            hash_move_id = self.next_move.move_id
+        else:
+            hash_move_id = self.transposition_table.get_best_move_id(board_hash)
 
         max_score = -self.CHECKMATE_SCORE
-        is_first_move = True
+        best_move = None
+        original_alpha = alpha
         reduction_factor = 1 # reduction factor for LMR
         move_log_length = len(game_state.move_log)
 
-        for move_idx, move in enumerate(valid_moves):
+        for move_idx, move in enumerate(self.pick_moves(game_state, valid_moves, hash_move_id, ply)):
             # handle pawn promotions
             if move.is_pawn_promotion:
                 promotion_piece = self.find_best_promotion_piece(game_state, move)
@@ -351,7 +1056,6 @@ class NegamaxBot:
                 not move.is_capture and
                 not move.is_check and
                 not move.is_pawn_promotion and  # don't reduce for promotions
-                not is_first_move and  # don't reduce first move
                 move_idx >= 4 and  # apply LMR only to moves further back in the list
                 move_log_length > 12  # apply LMR only after 6 full moves (12 plies)
             )
@@ -365,38 +1069,46 @@ class NegamaxBot:
                 # do not prune if captured piece value is equal or greater than the capturing piece
                 apply_lmr = False
 
-            if apply_lmr:
-                reduced_depth = depth - reduction_factor
-                score = -self.negamax_alpha_beta_pruning(game_state, next_moves, reduced_depth, -alpha - 1, -alpha, -turn_multiplier)
-                if score > alpha:  # search with full depth if reduced-depth search seems good
-                    score = -self.negamax_alpha_beta_pruning(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
-            else:
+            # principal variation search, the first move gets the full window and the rest only have to be shown to be no better,
+            # with a zero window around alpha (reduced if late and quiet), a move that beats it is searched again properly
+            if move_idx == 0:
                 score = -self.negamax_alpha_beta_pruning(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
+            else:
+                child_depth = depth - 1 - reduction_factor if apply_lmr else depth - 1
+                score = -self.negamax_alpha_beta_pruning(game_state, next_moves, child_depth, -alpha - self.NULL_WINDOW, -alpha, -turn_multiplier)
+                if score > alpha and apply_lmr:  # search with full depth if reduced-depth search seems good
+                    score = -self.negamax_alpha_beta_pruning(game_state, next_moves, depth - 1, -alpha - self.NULL_WINDOW, -alpha, -turn_multiplier)
+                if alpha < score < beta:
+                    score = -self.negamax_alpha_beta_pruning(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
 
             # Undo move
             game_state.undo_move()
 
             if score > max_score:
                 max_score = score
-                if depth == self.max_depth:
+                best_move = move
+                if is_root:
                     self.next_move = move
                     if move.is_pawn_promotion:
                         self.next_move.promotion_choice = promotion_piece  # store the chosen promotion piece
 
             if max_score > alpha:
                 alpha = max_score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
 
-            # alpha-beta pruning
+            # alpha-beta pruning, a good capture cuts off like any other move, the window is inverted from here on
             if alpha >= beta:
-                # avoid pruning if captured piece value is equal or greater than capturing piece
-                if move.is_capture and captured_piece_value >= capturing_piece_value:
-                    continue
+                if not move.is_capture and not move.is_pawn_promotion:
+                    self.record_cutoff(move, ply, depth, game_state.white_to_move)
                 break
 
-        is_first_move = False  # update after processing the first move
-        
         # store result in transposition table
-        flag = "exact" if alpha >= beta else ("lowerbound" if max_score > alpha else "upperbound")
-        self.zobrist_hashing.store_in_transposition_table(board_hash, depth, max_score, flag)
+        if max_score >= beta:
+            flag = "lowerbound"  # failed high, true score is at least max_score
+        elif max_score <= original_alpha:
+            flag = "upperbound"  # failed low, true score is at most max_score
+        else:
+            flag = "exact"
+        self.transposition_table.store_in_transposition_table(board_hash, depth, max_score, flag, best_move.move_id if best_move else None)
 
         return max_score
\ No newline at end of file
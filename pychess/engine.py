@@ -1,9 +1,49 @@
 import numpy as np
-import copy
+import random
 import tkinter as tk
 from PIL import Image, ImageTk, ImageFilter
+from pst import MG_TABLE, EG_TABLE, PHASE_WEIGHTS, taper, evaluate_piece_codes
+
+PIECE_INDEX = {
+    "wP": 0, "wR": 1, "wN": 2, "wB": 3, "wQ": 4, "wK": 5,
+    "bP": 6, "bR": 7, "bN": 8, "bB": 9, "bQ": 10, "bK": 11
+}
+PIECE_NAMES = [piece for piece, _ in sorted(PIECE_INDEX.items(), key=lambda item: item[1])] + [".."]
+EMPTY = 12  # piece index of an empty square
+WHITE_PAWN, WHITE_ROOK, WHITE_KNIGHT, WHITE_BISHOP, WHITE_QUEEN, WHITE_KING = range(6)
+BLACK_PAWN, BLACK_ROOK, BLACK_KNIGHT, BLACK_BISHOP, BLACK_QUEEN, BLACK_KING = range(6, 12)
+PROMOTION_PIECES = [None, "Q", "R", "B", "N"]
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# zobrist keys, seeded so hashes are the same in every process
+_zobrist_random = random.Random(2024)
+ZOBRIST_PIECE_KEYS = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]  # [piece][row * 8 + column]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING_KEYS = [0] + [_zobrist_random.getrandbits(64) for _ in range(15)]  # one per castling rights mask
+ZOBRIST_ENPASSANT_KEYS = [_zobrist_random.getrandbits(64) for _ in range(8)]  # one per enpassant file
+
+# castling rights bits, and the rights that survive a move touching each square (rooks and kings on their start squares)
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLE_RIGHTS_KEPT = [15] * 64
+CASTLE_RIGHTS_KEPT[0] = 15 & ~BLACK_QUEENSIDE  # a8
+CASTLE_RIGHTS_KEPT[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)  # e8
+CASTLE_RIGHTS_KEPT[7] = 15 & ~BLACK_KINGSIDE  # h8
+CASTLE_RIGHTS_KEPT[56] = 15 & ~WHITE_QUEENSIDE  # a1
+CASTLE_RIGHTS_KEPT[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # e1
+CASTLE_RIGHTS_KEPT[63] = 15 & ~WHITE_KINGSIDE  # h1
+
+# undo stack records: castling rights mask, enpassant square, ply count, captured piece, zobrist key, middlegame score, endgame score, phase
+UNDO_RECORD_SIZE = 8
+UNDO_STACK_PLIES = 256  # grows if a game ever goes past this
+
+# the eval tables as nested lists, indexing them with python ints is much faster than going through numpy
+MG_ROWS = MG_TABLE.tolist()
+EG_ROWS = EG_TABLE.tolist()
+PHASE_WEIGHT = PHASE_WEIGHTS.tolist()
 
 class GameState:
+    debug_eval = False # cross-check the incremental eval terms against a full recompute after every make_move/undo_move
+
     def __init__(self):
         self.board = np.array([
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
@@ -18,6 +58,7 @@ class GameState:
 
         self.move_log = []
         self.ply_count = 0
+        self.start_ply = 0 # plies played before the first move in move_log, for the fen fullmove number
         self.white_to_move = True
         self.white_king_location = (7, 4)
         self.black_king_location = (0, 4)
@@ -27,10 +68,196 @@ class GameState:
         self.checkmate = False
         self.stalemate = False
         self.enpassant_possible = () # coords for square where enpassant possible
-        self.enpassant_possible_log = [self.enpassant_possible]
         self.current_castling_rights = CastleRights(True, True, True, True)
-        self.castle_rights_log = [CastleRights(self.current_castling_rights.white_kingside, self.current_castling_rights.black_kingside, 
-                                               self.current_castling_rights.white_queenside, self.current_castling_rights.black_queenside)]
+        self.zobrist_key = self.compute_zobrist_key()
+        self.position_counts = {self.zobrist_key: 1} # times each zobrist key has come up in the game, kept in step by make_move/undo_move
+        self.piece_codes = self.compute_piece_codes() # integer copy of the board for numpy evaluation, kept in step by make_move/undo_move
+        self.reset_piece_lists() # squares and counts per PIECE_INDEX, also kept in step by make_move/undo_move
+        self.reset_eval_terms() # middlegame and endgame material + pst from white's point of view and the game phase, updated incrementally
+        self.undo_stack = [0] * (UNDO_STACK_PLIES * UNDO_RECORD_SIZE)  # flat and preallocated, make_move writes records in place
+        self.undo_count = 0
+
+    @classmethod
+    def from_fen(cls, fen):
+        game_state = cls()
+        game_state.set_fen(fen)
+        return game_state
+
+    def set_fen(self, fen):
+        # replaces the position, and clears the move history, raises ValueError if the fen can't be read
+        # the halfmove clock and fullmove number are optional, they default to 0 and 1
+        fields = fen.split()
+        if not 4 <= len(fields) <= 6:
+            raise ValueError(f"fen needs 4 to 6 fields: {fen!r}")
+        placement, side, castling, enpassant = fields[:4]
+        halfmove_clock, fullmove_number = (fields[4:] + ["0", "1"][len(fields) - 4:])[:2]
+
+        board = []
+        for rank in placement.split("/"):
+            row = []
+            for char in rank:
+                if char in "12345678":
+                    row += [".."] * int(char)
+                elif char in "PRNBQKprnbqk":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError(f"unknown piece {char!r} in fen: {fen!r}")
+            if len(row) != 8:
+                raise ValueError(f"rank {rank!r} doesn't have 8 squares: {fen!r}")
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError(f"fen needs 8 ranks: {fen!r}")
+        board = np.array(board, dtype="<U2")
+        if np.count_nonzero(board == "wK") != 1 or np.count_nonzero(board == "bK") != 1:
+            raise ValueError(f"fen needs one king of each color: {fen!r}")
+        if side not in ("w", "b"):
+            raise ValueError(f"side to move has to be w or b: {fen!r}")
+        if enpassant != "-" and (len(enpassant) != 2 or enpassant[0] not in Move.files_to_columns or enpassant[1] not in ("3", "6")):
+            raise ValueError(f"bad enpassant square {enpassant!r}: {fen!r}")
+        if not halfmove_clock.isdigit() or not fullmove_number.isdigit():
+            raise ValueError(f"move counters have to be numbers: {fen!r}")
+
+        self.board = board
+        self.white_to_move = side == "w"
+        # rights without the king and rook on their start squares are dropped, castling with them would make illegal moves
+        self.current_castling_rights = CastleRights(
+            "K" in castling and board[7, 4] == "wK" and board[7, 7] == "wR",
+            "k" in castling and board[0, 4] == "bK" and board[0, 7] == "bR",
+            "Q" in castling and board[7, 4] == "wK" and board[7, 0] == "wR",
+            "q" in castling and board[0, 4] == "bK" and board[0, 0] == "bR"
+        )
+        self.enpassant_possible = () if enpassant == "-" else (Move.ranks_to_rows[enpassant[1]], Move.files_to_columns[enpassant[0]])
+        self.ply_count = int(halfmove_clock)
+        self.start_ply = 2 * (max(1, int(fullmove_number)) - 1) + (0 if self.white_to_move else 1)
+        self.white_king_location = tuple(int(index) for index in np.argwhere(board == "wK")[0])
+        self.black_king_location = tuple(int(index) for index in np.argwhere(board == "bK")[0])
+
+        self.move_log = []
+        self.undo_count = 0
+        self.in_check = False
+        self.pins = []
+        self.checks = []
+        self.checkmate = False
+        self.stalemate = False
+        self.zobrist_key = self.compute_zobrist_key()
+        self.position_counts = {self.zobrist_key: 1}
+        self.piece_codes = self.compute_piece_codes()
+        self.reset_piece_lists()
+        self.reset_eval_terms()
+
+    def to_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "..":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+
+        mask = self.current_castling_rights.mask
+        castling = "".join(letter for letter, bit in (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE)) if mask & bit) or "-"
+        enpassant = Move.columns_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]] if self.enpassant_possible else "-"
+        fullmove_number = (self.start_ply + len(self.move_log)) // 2 + 1
+        return f"{'/'.join(ranks)} {'w' if self.white_to_move else 'b'} {castling} {enpassant} {self.ply_count} {fullmove_number}"
+
+    def compute_zobrist_key(self):
+        # full recompute, make_move/undo_move keep the key up to date incrementally
+        key = 0
+        for row in range(8):
+            for column in range(8):
+                piece = self.board[row, column]
+                if piece != "..":
+                    key ^= ZOBRIST_PIECE_KEYS[PIECE_INDEX[piece]][row * 8 + column]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING_KEYS[self.current_castling_rights.mask]
+        if self.enpassant_possible and self.enpassant_capturable():
+            key ^= ZOBRIST_ENPASSANT_KEYS[self.enpassant_possible[1]]
+        return key
+
+    def enpassant_capturable(self):
+        # the enpassant square only makes a different position, for hashing and repetitions, with a pawn next to it to take
+        row, column = self.enpassant_possible
+        pawn_row, pawn = (row + 1, "wP") if self.white_to_move else (row - 1, "bP")
+        return (column > 0 and self.board[pawn_row, column - 1] == pawn) or (column < 7 and self.board[pawn_row, column + 1] == pawn)
+
+    def compute_piece_codes(self):
+        # PIECE_INDEX code per square index row * 8 + column, EMPTY where there is no piece
+        return np.array([PIECE_INDEX.get(piece, EMPTY) for piece in self.board.ravel()], dtype=np.int8)
+
+    def reset_piece_lists(self):
+        # full recompute from piece_codes, piece_counts has a 13th slot for EMPTY that stays at 0
+        self.piece_squares = [set() for _ in range(12)]
+        for square, code in enumerate(self.piece_codes.tolist()):
+            if code != EMPTY:
+                self.piece_squares[code].add(square)
+        self.piece_counts = [len(squares) for squares in self.piece_squares] + [0]
+
+    def check_piece_lists(self):
+        expected = [set(np.flatnonzero(self.piece_codes == code).tolist()) for code in range(12)]
+        assert self.piece_squares == expected and self.piece_counts == [len(squares) for squares in expected] + [0], \
+            f"incremental piece lists {self.piece_squares} != recomputed {expected} after {[str(move) for move in self.move_log]}"
+
+    def compute_eval_terms(self):
+        squares = np.arange(64)
+        return float(MG_TABLE[self.piece_codes, squares].sum()), float(EG_TABLE[self.piece_codes, squares].sum()), int(PHASE_WEIGHTS[self.piece_codes].sum())
+
+    def reset_eval_terms(self):
+        # full recompute from piece_codes, for after the board was set up by hand
+        self.mg_score, self.eg_score, self.phase = self.compute_eval_terms()
+
+    @property
+    def eval_score(self):
+        # the middlegame and endgame scores blended by how much material is left
+        return taper(self.mg_score, self.eg_score, self.phase)
+
+    def compute_eval_score(self):
+        return evaluate_piece_codes(self.piece_codes)
+
+    def check_eval_score(self):
+        expected = self.compute_eval_terms()
+        actual = (self.mg_score, self.eg_score, self.phase)
+        assert all(abs(a - b) < 1e-6 for a, b in zip(actual, expected)), f"incremental eval terms {actual} != recomputed {expected} after {[str(move) for move in self.move_log]}"
+
+    def update_zobrist_key(self, move, old_castle_mask, old_enpassant):
+        key = self.zobrist_key
+        code = move.code
+        start = code & 0x3F
+        end = (code >> 6) & 0x3F
+        moved = (code >> 12) & 0xF
+        captured = (code >> 16) & 0xF
+
+        key ^= ZOBRIST_PIECE_KEYS[moved][start]
+        if code & Move.ENPASSANT_FLAG:
+            key ^= ZOBRIST_PIECE_KEYS[captured][(start & ~0x7) | (end & 0x7)]  # captured pawn sits beside the start square
+        elif captured != EMPTY:
+            key ^= ZOBRIST_PIECE_KEYS[captured][end]
+        if code & Move.PROMOTION_FLAG:
+            key ^= ZOBRIST_PIECE_KEYS[PIECE_INDEX[move.piece_moved[0] + move.promotion_choice]][end]
+        else:
+            key ^= ZOBRIST_PIECE_KEYS[moved][end]
+
+        if code & Move.CASTLE_FLAG:
+            rook_keys = ZOBRIST_PIECE_KEYS[moved - 4]  # king index - 4 is the rook of the same color
+            row_offset = end & ~0x7
+            if end > start:  # kingside castle
+                key ^= rook_keys[row_offset + 7] ^ rook_keys[row_offset + 5]
+            else:  # queenside castle
+                key ^= rook_keys[row_offset] ^ rook_keys[row_offset + 3]
+
+        key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING_KEYS[old_castle_mask] ^ ZOBRIST_CASTLING_KEYS[self.current_castling_rights.mask]
+        if old_enpassant:
+            key ^= ZOBRIST_ENPASSANT_KEYS[old_enpassant[1]]
+        if self.enpassant_possible and self.enpassant_capturable():
+            key ^= ZOBRIST_ENPASSANT_KEYS[self.enpassant_possible[1]]
+        self.zobrist_key = key
 
     def show_promotion_window(self, color):
         root = tk.Tk()
@@ -38,135 +265,221 @@ class GameState:
         root.mainloop()
         return window.selected_piece if window.selected_piece else "Q"
 
+    def push_undo_record(self, move):
+        index = self.undo_count * UNDO_RECORD_SIZE
+        if index == len(self.undo_stack):
+            self.undo_stack.extend([0] * (UNDO_STACK_PLIES * UNDO_RECORD_SIZE))
+        stack = self.undo_stack
+        stack[index] = self.current_castling_rights.mask
+        stack[index + 1] = self.enpassant_possible
+        stack[index + 2] = self.ply_count
+        stack[index + 3] = (move.code >> 16) & 0xF
+        stack[index + 4] = self.zobrist_key
+        stack[index + 5] = self.mg_score
+        stack[index + 6] = self.eg_score
+        stack[index + 7] = self.phase
+        self.undo_count += 1
+
+    def pop_undo_record(self):
+        self.undo_count -= 1
+        index = self.undo_count * UNDO_RECORD_SIZE
+        stack = self.undo_stack
+        self.current_castling_rights.mask = stack[index]
+        self.enpassant_possible = stack[index + 1]
+        self.ply_count = stack[index + 2]
+        self.zobrist_key = stack[index + 4]
+        self.mg_score = stack[index + 5]
+        self.eg_score = stack[index + 6]
+        self.phase = stack[index + 7]
+
     def make_move(self, move, promotion_choice=None):
-        self.board[move.start_row, move.start_column] = ".."
-        self.board[move.end_row, move.end_column] = move.piece_moved
+        self.push_undo_record(move)
+        old_castle_mask = self.current_castling_rights.mask
+        old_enpassant = self.enpassant_possible if self.enpassant_possible and self.enpassant_capturable() else () # only hashed when capturable
+        start_row, start_column, end_row, end_column = move.start_row, move.start_column, move.end_row, move.end_column
+        piece_moved = move.piece_moved
+        self.board[start_row, start_column] = ".."
+        self.board[end_row, end_column] = piece_moved
+        code = move.code
+        start, end = code & 0x3F, (code >> 6) & 0x3F
+        piece_codes = self.piece_codes
+        piece_codes[start] = EMPTY
+        piece_codes[end] = (code >> 12) & 0xF
+        piece_squares, piece_counts = self.piece_squares, self.piece_counts
+        moved_squares = piece_squares[(code >> 12) & 0xF]
+        moved_squares.remove(start)
+        moved_squares.add(end)
+        captured = (code >> 16) & 0xF
+        if captured != EMPTY and not code & (1 << 20): # enpassant is taken off below
+            piece_squares[captured].remove(end)
+            piece_counts[captured] -= 1
+        moved_mg, moved_eg = MG_ROWS[(code >> 12) & 0xF], EG_ROWS[(code >> 12) & 0xF]
+        mg_score = self.mg_score + moved_mg[end] - moved_mg[start]
+        eg_score = self.eg_score + moved_eg[end] - moved_eg[start]
+        phase = self.phase - PHASE_WEIGHT[(code >> 16) & 0xF] # an empty square weighs nothing
+        if not code & (1 << 20): # enpassant captures off the end square, handled below
+            mg_score -= MG_ROWS[(code >> 16) & 0xF][end]
+            eg_score -= EG_ROWS[(code >> 16) & 0xF][end]
         self.move_log.append(move)  # log move to be able to undo later (or show move history)
         self.white_to_move = not self.white_to_move  # switch turns
         # update king's position
-        if move.piece_moved == "wK":
-            self.white_king_location = (move.end_row, move.end_column)
-        elif move.piece_moved == "bK":
-            self.black_king_location = (move.end_row, move.end_column)
+        if piece_moved == "wK":
+            self.white_king_location = (end_row, end_column)
+        elif piece_moved == "bK":
+            self.black_king_location = (end_row, end_column)
 
         # pawn promotion
         if move.is_pawn_promotion:
-            color = move.piece_moved[0]
+            color = piece_moved[0]
 
             if promotion_choice:  # Use the promotion piece passed by the AI
                 promoted_piece = promotion_choice
             else:
                 promoted_piece = self.show_promotion_window(color)  # Show promotion window only if no choice is passed
-            self.board[move.end_row, move.end_column] = color + promoted_piece
+            self.board[end_row, end_column] = color + promoted_piece
+            piece_codes[end] = PIECE_INDEX[color + promoted_piece]
+            moved_squares.remove(end)
+            piece_squares[piece_codes[end]].add(end)
+            piece_counts[(code >> 12) & 0xF] -= 1
+            piece_counts[piece_codes[end]] += 1
+            mg_score += MG_ROWS[piece_codes[end]][end] - moved_mg[end]
+            eg_score += EG_ROWS[piece_codes[end]][end] - moved_eg[end]
+            phase += PHASE_WEIGHT[piece_codes[end]]
             move.promotion_choice = promoted_piece
         
         # enpassant
         if move.is_enpassant_move:
-            self.board[move.start_row, move.end_column] = ".."  # capturing the pawn
+            self.board[start_row, end_column] = ".."  # capturing the pawn
+            piece_codes[start_row * 8 + end_column] = EMPTY
+            piece_squares[captured].remove(start_row * 8 + end_column)
+            piece_counts[captured] -= 1
+            mg_score -= MG_ROWS[(code >> 16) & 0xF][start_row * 8 + end_column]
+            eg_score -= EG_ROWS[(code >> 16) & 0xF][start_row * 8 + end_column]
         
         # update enpassant_possible
-        if move.piece_moved[1] == "P" and abs(move.start_row - move.end_row) == 2:  # only on 2 square pawn advance
-            self.enpassant_possible = ((move.start_row + move.end_row) // 2, move.start_column)
+        if piece_moved[1] == "P" and abs(start_row - end_row) == 2:  # only on 2 square pawn advance
+            self.enpassant_possible = ((start_row + end_row) // 2, start_column)
         else:
             self.enpassant_possible = ()
 
         # castle move
         if move.is_castle_move:
-            if move.end_column - move.start_column == 2:  # kingside castle
-                self.board[move.end_row, move.end_column - 1] = self.board[move.end_row, move.end_column + 1]  # copies rook into new square
-                self.board[move.end_row, move.end_column + 1] = ".."  # erase old rook
+            if end_column - start_column == 2:  # kingside castle
+                self.board[end_row, end_column - 1] = self.board[end_row, end_column + 1]  # copies rook into new square
+                self.board[end_row, end_column + 1] = ".."  # erase old rook
+                piece_codes[end - 1] = piece_codes[end + 1]
+                piece_codes[end + 1] = EMPTY
+                piece_squares[piece_codes[end - 1]].remove(end + 1)
+                piece_squares[piece_codes[end - 1]].add(end - 1)
+                rook_mg, rook_eg = MG_ROWS[piece_codes[end - 1]], EG_ROWS[piece_codes[end - 1]]
+                mg_score += rook_mg[end - 1] - rook_mg[end + 1]
+                eg_score += rook_eg[end - 1] - rook_eg[end + 1]
             else:  # queenside castle
-                self.board[move.end_row, move.end_column + 1] = self.board[move.end_row, move.end_column - 2]  # copies rook into new square
-                self.board[move.end_row, move.end_column - 2] = ".."  # erase old rook
-
-        self.enpassant_possible_log.append(self.enpassant_possible)
+                self.board[end_row, end_column + 1] = self.board[end_row, end_column - 2]  # copies rook into new square
+                self.board[end_row, end_column - 2] = ".."  # erase old rook
+                piece_codes[end + 1] = piece_codes[end - 2]
+                piece_codes[end - 2] = EMPTY
+                piece_squares[piece_codes[end + 1]].remove(end - 2)
+                piece_squares[piece_codes[end + 1]].add(end + 1)
+                rook_mg, rook_eg = MG_ROWS[piece_codes[end + 1]], EG_ROWS[piece_codes[end + 1]]
+                mg_score += rook_mg[end + 1] - rook_mg[end - 2]
+                eg_score += rook_eg[end + 1] - rook_eg[end - 2]
 
         # update castling rights
         self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.current_castling_rights.white_kingside, self.current_castling_rights.black_kingside, 
-                                                self.current_castling_rights.white_queenside, self.current_castling_rights.black_queenside))
 
         # check if the move is a pawn move or a capture (for 50 move rule)
-        if move.piece_moved[1] == "P" or move.is_capture:
+        if piece_moved[1] == "P" or move.is_capture:
             self.ply_count = 0  # reset on pawn move or capture
         else:
             self.ply_count += 1  # increment otherwise
 
+        self.update_zobrist_key(move, old_castle_mask, old_enpassant)
+        position_counts = self.position_counts
+        position_counts[self.zobrist_key] = position_counts.get(self.zobrist_key, 0) + 1
+        self.mg_score, self.eg_score, self.phase = mg_score, eg_score, phase
+        if self.debug_eval:
+            self.check_eval_score()
+            self.check_piece_lists()
+
     def undo_move(self):
         if len(self.move_log) != 0:  # make sure there is a move to undo
             last_move = self.move_log.pop()
+            start_row, start_column, end_row, end_column = last_move.start_row, last_move.start_column, last_move.end_row, last_move.end_column
+            piece_moved, piece_captured = last_move.piece_moved, last_move.piece_captured
 
             # Undo the move using numpy array slicing
-            self.board[last_move.start_row, last_move.start_column] = last_move.piece_moved
-            self.board[last_move.end_row, last_move.end_column] = last_move.piece_captured
+            self.board[start_row, start_column] = piece_moved
+            self.board[end_row, end_column] = piece_captured
+            code = last_move.code
+            start, end = code & 0x3F, (code >> 6) & 0x3F
+            piece_codes = self.piece_codes
+            piece_squares, piece_counts = self.piece_squares, self.piece_counts
+            moved, captured = (code >> 12) & 0xF, (code >> 16) & 0xF
+            if code & (1 << 22): # the promoted piece goes back to being the pawn
+                piece_squares[piece_codes[end]].remove(end)
+                piece_counts[piece_codes[end]] -= 1
+                piece_counts[moved] += 1
+            else:
+                piece_squares[moved].remove(end)
+            piece_squares[moved].add(start)
+            if captured != EMPTY and not code & (1 << 20):
+                piece_squares[captured].add(end)
+                piece_counts[captured] += 1
+            piece_codes[start] = moved
+            piece_codes[end] = captured
             self.white_to_move = not self.white_to_move  # switch turns after undo
 
             # Update king's position
-            if last_move.piece_moved == "wK":
-                self.white_king_location = (last_move.start_row, last_move.start_column)
-            elif last_move.piece_moved == "bK":
-                self.black_king_location = (last_move.start_row, last_move.start_column)
+            if piece_moved == "wK":
+                self.white_king_location = (start_row, start_column)
+            elif piece_moved == "bK":
+                self.black_king_location = (start_row, start_column)
 
             # Undo enpassant move
             if last_move.is_enpassant_move:
-                self.board[last_move.end_row, last_move.end_column] = ".."  # leave landing square blank
-                self.board[last_move.start_row, last_move.end_column] = last_move.piece_captured
-
-            self.enpassant_possible_log.pop()
-            self.enpassant_possible = copy.deepcopy(self.enpassant_possible_log[-1])
-
-            # Undo castling rights
-            self.castle_rights_log.pop()  # get rid of new castle rights from move we are undoing
-            self.current_castling_rights = copy.deepcopy(self.castle_rights_log[-1])  # set to last value
+                self.board[end_row, end_column] = ".."  # leave landing square blank
+                self.board[start_row, end_column] = piece_captured
+                piece_codes[end] = EMPTY
+                piece_codes[start_row * 8 + end_column] = captured
+                piece_squares[captured].add(start_row * 8 + end_column)
+                piece_counts[captured] += 1
+
+            # forget the position being left, then restore castling rights, enpassant square, ply count and zobrist key
+            position_counts = self.position_counts
+            if position_counts[self.zobrist_key] == 1:
+                del position_counts[self.zobrist_key]  # dropped so the counts don't fill up with every position searched
+            else:
+                position_counts[self.zobrist_key] -= 1
+            self.pop_undo_record()
 
             # Undo castle move
             if last_move.is_castle_move:
-                if last_move.end_column - last_move.start_column == 2:  # kingside castle
-                    self.board[last_move.end_row, last_move.end_column + 1] = self.board[last_move.end_row, last_move.end_column - 1]
-                    self.board[last_move.end_row, last_move.end_column - 1] = ".."
+                if end_column - start_column == 2:  # kingside castle
+                    self.board[end_row, end_column + 1] = self.board[end_row, end_column - 1]
+                    self.board[end_row, end_column - 1] = ".."
+                    piece_codes[end + 1] = piece_codes[end - 1]
+                    piece_codes[end - 1] = EMPTY
+                    piece_squares[piece_codes[end + 1]].remove(end - 1)
+                    piece_squares[piece_codes[end + 1]].add(end + 1)
                 else:  # queenside castle
-                    self.board[last_move.end_row, last_move.end_column - 2] = self.board[last_move.end_row, last_move.end_column + 1]
-                    self.board[last_move.end_row, last_move.end_column + 1] = ".."
+                    self.board[end_row, end_column - 2] = self.board[end_row, end_column + 1]
+                    self.board[end_row, end_column + 1] = ".."
+                    piece_codes[end - 2] = piece_codes[end + 1]
+                    piece_codes[end + 1] = EMPTY
+                    piece_squares[piece_codes[end - 2]].remove(end + 1)
+                    piece_squares[piece_codes[end - 2]].add(end - 2)
 
             self.checkmate = False
             self.stalemate = False
+            if self.debug_eval:
+                self.check_eval_score()
+                self.check_piece_lists()
 
     def update_castle_rights(self, move):
-        if move.piece_moved == "wK":
-            self.current_castling_rights.white_kingside = False
-            self.current_castling_rights.white_queenside = False
-
-        elif move.piece_moved == "bK":
-            self.current_castling_rights.black_kingside = False
-            self.current_castling_rights.black_queenside = False
-
-        elif move.piece_moved == "wR":
-            if move.start_row == 7:
-                if move.start_column == 0: # left rook
-                    self.current_castling_rights.white_queenside = False
-                elif move.start_column == 7: # right rook
-                    self.current_castling_rights.white_kingside = False
-
-        elif move.piece_moved == "bR":
-            if move.start_row == 0:
-                if move.start_column == 0: # left rook
-                    self.current_castling_rights.black_queenside = False
-                elif move.start_column == 7: # right rook
-                    self.current_castling_rights.black_kingside = False
-        
-        # if a rook is captured
-        if move.piece_captured == 'wR':
-            if move.end_row == 7:
-                if move.end_column == 0:
-                    self.current_castling_rights.white_queenside = False
-                elif move.end_column == 7:
-                    self.current_castling_rights.white_kingside = False
-        elif move.piece_captured == 'bR':
-            if move.end_row == 0:
-                if move.end_column == 0:
-                    self.current_castling_rights.black_queenside = False
-                elif move.end_column == 7:
-                    self.current_castling_rights.black_kingside = False
+        # a king or rook leaving its start square, or a rook being captured on it, loses those rights
+        code = move.code
+        self.current_castling_rights.mask &= CASTLE_RIGHTS_KEPT[code & 0x3F] & CASTLE_RIGHTS_KEPT[(code >> 6) & 0x3F]
 
     def get_pawn_moves(self, row, column, moves):
         piece_pinned = False
@@ -182,7 +495,7 @@ class GameState:
             king_row, king_column = self.white_king_location
             if row - 1 >= 0:
                 if self.board[row - 1, column] == "..":  # 1 square pawn advance
-                    if not piece_pinned or pin_direction == (-1, 0):
+                    if not piece_pinned or pin_direction in ((-1, 0), (1, 0)):  # pinned along the file from either side
                         if row - 1 == 0:  # Promotion
                             moves.append(Move((row, column), (row - 1, column), self.board))
                         else:
@@ -254,7 +567,7 @@ class GameState:
             king_row, king_column = self.black_king_location
             if row + 1 <= 7:
                 if self.board[row + 1, column] == "..":  # 1 square pawn advance
-                    if not piece_pinned or pin_direction == (1, 0):
+                    if not piece_pinned or pin_direction in ((-1, 0), (1, 0)):  # pinned along the file from either side
                         if row + 1 == 7:  # Promotion
                             moves.append(Move((row, column), (row + 1, column), self.board))
                         else:
@@ -518,56 +831,42 @@ class GameState:
 
         return in_check, pins, checks
 
-    def check_for_insufficient_material(self):
-        # Get the piece count for each side
-        white_pieces = [piece for row in self.board for piece in row if piece[0] == 'w']
-        black_pieces = [piece for row in self.board for piece in row if piece[0] == 'b']
+    def is_in_check(self):
+        # whether the side to move is in check, without generating any moves, in_check is only up to date after get_valid_moves
+        king_row, king_column = self.white_king_location if self.white_to_move else self.black_king_location
+        return self.check_for_pins_and_checks(king_row, king_column)[0]
 
-        # If either player has a queen, rook, or pawn, it's not insufficient material
-        if any(piece[1] in 'QR' for piece in white_pieces + black_pieces):
+    def check_for_insufficient_material(self):
+        # no sequence of moves can end in mate: king vs king with one minor piece, two knights, or same colored bishops on each side
+        counts = self.piece_counts
+        if counts[WHITE_PAWN] or counts[WHITE_ROOK] or counts[WHITE_QUEEN] or counts[BLACK_PAWN] or counts[BLACK_ROOK] or counts[BLACK_QUEEN]:
             return False
-
-        # Count knights and bishops for each side
-        white_knights = len([piece for piece in white_pieces if piece[1] == 'N'])
-        white_bishops = len([piece for piece in white_pieces if piece[1] == 'B'])
-        black_knights = len([piece for piece in black_pieces if piece[1] == 'N'])
-        black_bishops = len([piece for piece in black_pieces if piece[1] == 'B'])
-
-        # Handle insufficient material scenarios
-        if len(white_pieces) == 1 and len(black_pieces) == 1:  # King vs King
-            return True
-        if len(white_pieces) == 2 and white_knights == 1 and len(black_pieces) == 1:  # King + Knight vs King
-            return True
-        if len(white_pieces) == 2 and white_bishops == 1 and len(black_pieces) == 1:  # King + Bishop vs King
+        white_minors = counts[WHITE_KNIGHT] + counts[WHITE_BISHOP]
+        black_minors = counts[BLACK_KNIGHT] + counts[BLACK_BISHOP]
+        if white_minors + black_minors <= 1:
             return True
-        if len(black_pieces) == 2 and black_knights == 1 and len(white_pieces) == 1:  # King vs King + Knight
+        if black_minors == 0 and counts[WHITE_KNIGHT] == 2 and counts[WHITE_BISHOP] == 0: # king + 2 knights vs king
             return True
-        if len(black_pieces) == 2 and black_bishops == 1 and len(white_pieces) == 1:  # King vs King + Bishop
+        if white_minors == 0 and counts[BLACK_KNIGHT] == 2 and counts[BLACK_BISHOP] == 0:
             return True
-        if len(white_pieces) == 3 and white_knights == 2 and len(black_pieces) == 1:  # King + 2 Knights vs King
-            return True
-        if len(black_pieces) == 3 and black_knights == 2 and len(white_pieces) == 1:  # King vs King + 2 Knights
-            return True
-        if len(white_pieces) == 2 and len(black_pieces) == 2 and white_bishops == 1 and black_bishops == 1:  # King + Bishop vs King + Bishop
-            # Check if bishops are on the same color
-            white_bishop_square = [(r, c) for r, row in enumerate(self.board) for c, piece in enumerate(row) if piece == 'wB']
-            black_bishop_square = [(r, c) for r, row in enumerate(self.board) for c, piece in enumerate(row) if piece == 'bB']
-            if white_bishop_square and black_bishop_square:
-                wb_square = white_bishop_square[0]
-                bb_square = black_bishop_square[0]
-                # Bishops on the same color
-                if (wb_square[0] + wb_square[1]) % 2 == (bb_square[0] + bb_square[1]) % 2:
-                    return True
-
+        if white_minors == 1 and black_minors == 1 and counts[WHITE_BISHOP] and counts[BLACK_BISHOP]: # bishops on the same color
+            (white_bishop,), (black_bishop,) = self.piece_squares[WHITE_BISHOP], self.piece_squares[BLACK_BISHOP]
+            return ((white_bishop >> 3) + (white_bishop & 7)) % 2 == ((black_bishop >> 3) + (black_bishop & 7)) % 2
         return False
 
     def check_for_threefold_repetition(self):
-        if len(self.move_log) >= 8: # make sure there are at least 4 moves
-            last_four_moves = self.move_log[-8:]
-            if (last_four_moves[0] == last_four_moves[4] and last_four_moves[2] == last_four_moves[6]) and \
-                (last_four_moves[1] == last_four_moves[5] and last_four_moves[3] == last_four_moves[7]):
+        # positions before a pawn move, capture or lost castling right can't come back, so counting keys over the whole game is enough
+        return self.position_counts[self.zobrist_key] >= 3
+
+    def is_repetition(self):
+        # true if the position already came up since the last pawn move or capture, for the search where one repeat is scored as a draw
+        # the undo records hold the key of every earlier position, only ones with the same side to move, 4 or more plies back, can match
+        key = self.zobrist_key
+        stack = self.undo_stack
+        oldest = max(0, self.undo_count - self.ply_count)
+        for index in range((self.undo_count - 4) * UNDO_RECORD_SIZE + 4, oldest * UNDO_RECORD_SIZE - 1, -2 * UNDO_RECORD_SIZE):
+            if stack[index] == key:
                 return True
-        
         return False
 
     def check_for_fifty_move_rule(self):
@@ -633,7 +932,9 @@ class GameState:
                 for i in range(len(moves) - 1, -1, -1): # go through list of moves backward
                     if moves[i].piece_moved[1] != "K": # move doesn't move king so must block or capture
                         if not (moves[i].end_row, moves[i].end_column) in valid_squares: # move doesn't block check or capture piece
-                            moves.remove(moves[i])
+                            # enpassant lands behind the checking pawn but still captures it
+                            if not (moves[i].is_enpassant_move and (moves[i].start_row, moves[i].end_column) == (check_row, check_column)):
+                                moves.remove(moves[i])
             else: # double-check, king must move
                 self.get_king_moves(king_row, king_column, moves)
         else: # not in check so all moves are fine
@@ -650,19 +951,152 @@ class GameState:
             self.checkmate = False
             self.stalemate = False
 
+        check_info = CheckInfo(self)
         for move in moves:
-            move.evaluate_move(self)
+            move.check_info = check_info
 
         return moves
 
+    def get_capture_moves(self):
+        # legal captures and promotions, for quiescence search
+        # the board array generator has no capture-only mode, BitboardGameState overrides this with one
+        return [move for move in self.get_valid_moves() if move.is_capture or move.is_pawn_promotion]
+
 class CastleRights:
+    # stored as a 4-bit mask so the undo stack can save and restore it as a plain int
     def __init__(self, white_kingside, black_kingside, white_queenside, black_queenside):
-        self.white_kingside = white_kingside
-        self.black_kingside = black_kingside
-        self.white_queenside = white_queenside
-        self.black_queenside = black_queenside
+        self.mask = (WHITE_KINGSIDE if white_kingside else 0) | (BLACK_KINGSIDE if black_kingside else 0) | \
+                    (WHITE_QUEENSIDE if white_queenside else 0) | (BLACK_QUEENSIDE if black_queenside else 0)
+
+    def get_right(self, bit):
+        return self.mask & bit != 0
+
+    def set_right(self, bit, value):
+        self.mask = self.mask | bit if value else self.mask & ~bit
+
+    white_kingside = property(lambda self: self.get_right(WHITE_KINGSIDE), lambda self, value: self.set_right(WHITE_KINGSIDE, value))
+    white_queenside = property(lambda self: self.get_right(WHITE_QUEENSIDE), lambda self, value: self.set_right(WHITE_QUEENSIDE, value))
+    black_kingside = property(lambda self: self.get_right(BLACK_KINGSIDE), lambda self, value: self.set_right(BLACK_KINGSIDE, value))
+    black_queenside = property(lambda self: self.get_right(BLACK_QUEENSIDE), lambda self, value: self.set_right(BLACK_QUEENSIDE, value))
+
+    def to_mask(self):
+        return self.mask
+
+class CheckInfo:
+    # everything needed to tell whether a move gives check, computed once per position
+    # moves keep a reference to it and only ask when something needs move.is_check
+    orthogonal_directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+    diagonal_directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+    knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+    def __init__(self, game_state):
+        self.squares = game_state.board.ravel().tolist()  # snapshot, the position will have moved on by the time we're asked
+        self.ally_color = "w" if game_state.white_to_move else "b"
+        self.king_row, self.king_column = game_state.black_king_location if game_state.white_to_move else game_state.white_king_location
+
+        # squares each piece type would give check from
+        self.direct_checks = {"P": set(), "N": set(), "B": set(), "R": set(), "Q": set(), "K": set()}
+        pawn_row = self.king_row + (1 if self.ally_color == "w" else -1)
+        for column in (self.king_column - 1, self.king_column + 1):
+            if 0 <= pawn_row < 8 and 0 <= column < 8:
+                self.direct_checks["P"].add(pawn_row * 8 + column)
+        for row_step, column_step in self.knight_moves:
+            row, column = self.king_row + row_step, self.king_column + column_step
+            if 0 <= row < 8 and 0 <= column < 8:
+                self.direct_checks["N"].add(row * 8 + column)
+
+        # allied pieces standing between the king and an allied slider, mapped to the line they block
+        self.discovered_checks = {}
+        for directions, piece_type, sliders in ((self.orthogonal_directions, "R", "RQ"), (self.diagonal_directions, "B", "BQ")):
+            for direction in directions:
+                blocker = None
+                row, column = self.king_row + direction[0], self.king_column + direction[1]
+                while 0 <= row < 8 and 0 <= column < 8:
+                    piece = self.squares[row * 8 + column]
+                    if blocker is None:
+                        self.direct_checks[piece_type].add(row * 8 + column)
+                    if piece != "..":
+                        if blocker is not None:
+                            if piece[0] == self.ally_color and piece[1] in sliders:
+                                self.discovered_checks[blocker] = direction
+                            break
+                        if piece[0] != self.ally_color:
+                            break
+                        blocker = row * 8 + column
+                    row, column = row + direction[0], column + direction[1]
+        self.direct_checks["Q"] = self.direct_checks["R"] | self.direct_checks["B"]
+
+    def gives_check(self, move):
+        if move.is_castle_move or move.is_enpassant_move or move.is_pawn_promotion:
+            return self.gives_check_after_replay(move)
+
+        start = move.start_row * 8 + move.start_column
+        end = move.end_row * 8 + move.end_column
+        if end in self.direct_checks[move.piece_moved[1]]:
+            return True
+
+        direction = self.discovered_checks.get(start)
+        if direction is not None:
+            # the blocker uncovers the slider unless it stays on the same line
+            row_offset = move.end_row - self.king_row
+            column_offset = move.end_column - self.king_column
+            return row_offset * direction[1] != column_offset * direction[0]
+        return False
+
+    def gives_check_after_replay(self, move):
+        # rare moves that touch more than two squares, replay them on a copy of the snapshot
+        squares = self.squares.copy()
+        squares[move.start_row * 8 + move.start_column] = ".."
+        if move.is_pawn_promotion:
+            squares[move.end_row * 8 + move.end_column] = self.ally_color + (move.promotion_choice or "Q")
+        else:
+            squares[move.end_row * 8 + move.end_column] = move.piece_moved
+        if move.is_enpassant_move:
+            squares[move.start_row * 8 + move.end_column] = ".."
+        if move.is_castle_move:
+            row_offset = move.end_row * 8
+            if move.end_column - move.start_column == 2:  # kingside castle
+                squares[row_offset + 7], squares[row_offset + 5] = "..", self.ally_color + "R"
+            else:  # queenside castle
+                squares[row_offset], squares[row_offset + 3] = "..", self.ally_color + "R"
+        return self.is_king_attacked(squares)
+
+    def is_king_attacked(self, squares):
+        for directions, sliders in ((self.orthogonal_directions, "RQ"), (self.diagonal_directions, "BQ")):
+            for direction in directions:
+                row, column = self.king_row + direction[0], self.king_column + direction[1]
+                while 0 <= row < 8 and 0 <= column < 8:
+                    piece = squares[row * 8 + column]
+                    if piece != "..":
+                        if piece[0] == self.ally_color and piece[1] in sliders:
+                            return True
+                        break
+                    row, column = row + direction[0], column + direction[1]
+
+        for row_step, column_step in self.knight_moves:
+            row, column = self.king_row + row_step, self.king_column + column_step
+            if 0 <= row < 8 and 0 <= column < 8 and squares[row * 8 + column] == self.ally_color + "N":
+                return True
+        for square in self.direct_checks["P"]:
+            if squares[square] == self.ally_color + "P":
+                return True
+        return False
 
 class Move:
+    # a move is a single packed int, the other attributes are decoded from it on demand
+    #   bits 0-5   start square (row * 8 + column)
+    #   bits 6-11  end square
+    #   bits 12-15 piece moved (PIECE_INDEX)
+    #   bits 16-19 piece captured (PIECE_INDEX, EMPTY if none)
+    #   bit  20    enpassant, bit 21 castle, bit 22 pawn promotion
+    #   bits 23-25 promotion choice (index into PROMOTION_PIECES)
+    # equality and hashing use the start and end squares (move_id), same as before
+    __slots__ = ("code", "check_info", "_is_check")
+
+    ENPASSANT_FLAG = 1 << 20
+    CASTLE_FLAG = 1 << 21
+    PROMOTION_FLAG = 1 << 22
+
     # chess notation mappings
     ranks_to_rows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rows_to_ranks = {v: k for k, v in ranks_to_rows.items()}
@@ -670,49 +1104,122 @@ class Move:
     columns_to_files = {v: k for k, v in files_to_columns.items()}
 
     def __init__(self, start_square, end_square, board, is_enpassant_move=False, is_castle_move=False, promotion_choice=None):
-        self.start_square = start_square
-        self.end_square = end_square
-        self.start_row = start_square[0]
-        self.start_column = start_square[1]
-        self.end_row = end_square[0]
-        self.end_column = end_square[1]
-        self.piece_moved = board[self.start_row, self.start_column]  # Use numpy array indexing
-        self.piece_captured = board[self.end_row, self.end_column]  # Use numpy array indexing
-        self.is_pawn_promotion = (self.piece_moved == "wP" and self.end_row == 0) or (self.piece_moved == "bP" and self.end_row == 7)
-        self.promotion_choice = promotion_choice
-        self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.piece_captured = "wP" if self.piece_moved == "bP" else "bP"
-        # castle move
-        self.is_castle_move = is_castle_move
-        self.is_capture = self.piece_captured != ".."
-        self.is_check = False
-        self.move_id = self.start_row * 1000 + self.start_column * 100 + self.end_row * 10 + self.end_column
-
-    def evaluate_move(self, game_state):
-        # temporarily make the move
-        for piece in ["N", "B", "R", "Q"]:
-            game_state.make_move(self, promotion_choice=piece)
-
-            # get the opponent's king location
-            king_row, king_column = (
-                game_state.white_king_location if game_state.white_to_move else game_state.black_king_location
-            )
-
-            # check if the opponent's king is in check
-            in_check, _, _ = game_state.check_for_pins_and_checks(king_row, king_column)
-
-            # undo the move
-            game_state.undo_move()
-
-            self.is_check = in_check
+        start_row, start_column = start_square
+        end_row, end_column = end_square
+        piece_moved = PIECE_INDEX[board[start_row, start_column]]
+        if is_enpassant_move:
+            piece_captured = PIECE_INDEX["wP" if piece_moved == PIECE_INDEX["bP"] else "bP"]
+        else:
+            piece_captured = PIECE_INDEX.get(board[end_row, end_column], EMPTY)
+        self.code = Move.encode(start_row * 8 + start_column, end_row * 8 + end_column, piece_moved, piece_captured, is_enpassant_move, is_castle_move)
+        self.check_info = None  # set by get_valid_moves, is_check is worked out from it on first use
+        self._is_check = None
+        if promotion_choice:
+            self.promotion_choice = promotion_choice
+
+    @staticmethod
+    def encode(start, end, piece_moved, piece_captured=EMPTY, is_enpassant_move=False, is_castle_move=False):
+        code = start | end << 6 | piece_moved << 12 | piece_captured << 16
+        if is_enpassant_move:
+            code |= Move.ENPASSANT_FLAG
+        if is_castle_move:
+            code |= Move.CASTLE_FLAG
+        if (piece_moved == 0 and end < 8) or (piece_moved == 6 and end >= 56):  # pawn reaching the last rank
+            code |= Move.PROMOTION_FLAG
+        return code
+
+    @classmethod
+    def from_code(cls, code, is_check=None):
+        # cheap constructor for generators and for moves coming back from another process or the transposition table
+        move = cls.__new__(cls)
+        move.code = code
+        move.check_info = None
+        move._is_check = is_check
+        return move
+
+    def __reduce__(self):
+        # pickles as the int, is_check is resolved first since the check info stays behind
+        return (Move.from_code, (self.code, self.is_check))
+
+    @property
+    def move_id(self):
+        return self.code & 0xFFF
+
+    @property
+    def start_row(self):
+        return (self.code & 0x3F) >> 3
+
+    @property
+    def start_column(self):
+        return self.code & 0x7
+
+    @property
+    def end_row(self):
+        return (self.code >> 9) & 0x7
+
+    @property
+    def end_column(self):
+        return (self.code >> 6) & 0x7
+
+    @property
+    def start_square(self):
+        return (self.start_row, self.start_column)
+
+    @property
+    def end_square(self):
+        return (self.end_row, self.end_column)
+
+    @property
+    def piece_moved(self):
+        return PIECE_NAMES[(self.code >> 12) & 0xF]
+
+    @property
+    def piece_captured(self):
+        return PIECE_NAMES[(self.code >> 16) & 0xF]
+
+    @property
+    def is_capture(self):
+        return (self.code >> 16) & 0xF != EMPTY
+
+    @property
+    def is_enpassant_move(self):
+        return self.code & Move.ENPASSANT_FLAG != 0
+
+    @property
+    def is_castle_move(self):
+        return self.code & Move.CASTLE_FLAG != 0
+
+    @property
+    def is_pawn_promotion(self):
+        return self.code & Move.PROMOTION_FLAG != 0
+
+    @property
+    def promotion_choice(self):
+        return PROMOTION_PIECES[(self.code >> 23) & 0x7]
+
+    @promotion_choice.setter
+    def promotion_choice(self, piece):
+        self.code = (self.code & ~(0x7 << 23)) | (PROMOTION_PIECES.index(piece) << 23)
+
+    @property
+    def is_check(self):
+        if self._is_check is None:
+            self._is_check = self.check_info.gives_check(self) if self.check_info is not None else False
+        return self._is_check
+
+    @is_check.setter
+    def is_check(self, value):
+        self._is_check = value
 
     # overriding the equals method
     def __eq__(self, value):
         if isinstance(value, Move):
-            return self.move_id == value.move_id
+            return self.code & 0xFFF == value.code & 0xFFF
         return False
 
+    def __hash__(self):
+        return self.code & 0xFFF
+
     def get_uci_notation(self):
         return self.get_rank_file(self.start_row, self.start_column) + self.get_rank_file(self.end_row, self.end_column)
 
@@ -730,14 +1237,14 @@ class Move:
         if self.piece_moved[1] == "P":
             move_symbol = ""
             if self.is_pawn_promotion:
-                move_symbol += "=" + self.promotion_choice + ("+" if self.is_check else "")
+                move_symbol += "=" + (self.promotion_choice or "Q")
+            move_symbol += "+" if self.is_check else ""
             if self.is_capture:
-                return self.columns_to_files[self.start_column] + "x" + end_square + move_symbol + ("+" if self.is_check else "")
+                return self.columns_to_files[self.start_column] + "x" + end_square + move_symbol
             else:
                 return end_square + move_symbol
-            
-        
-        # TODO: disambiguation
+
+        # a move on its own can't be disambiguated or tell check from mate, pgn.move_to_san does both with the legal moves
 
         move_string = self.piece_moved[1]
         if self.is_capture:
@@ -1,10 +1,16 @@
+import argparse
 import time
-from multiprocessing import Process, Queue
+from datetime import date
+from worker import SearchWorker
+from book import OpeningBook
+from tablebase import Tablebases
 import tkinter as tk
 from PIL import Image, ImageTk, ImageFilter
 import pygame
 import engine as ChessEngine
+import bitboard as Bitboard
 import bot as ChessBot
+import pgn as ChessPgn
 
 BOARD_WIDTH = BOARD_HEIGHT = 1024
 MOVE_LOG_PANEL_WIDTH = 520
@@ -73,17 +79,28 @@ def draw_pieces(screen: pygame.display, board: list[list[str]]) -> None:
             if piece != "..": # Not empty square
                 screen.blit(IMAGES[piece], pygame.Rect(column * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
 
-def draw_move_log(screen: pygame.display, game_state: ChessEngine.GameState, font: pygame.font) -> None:
+def update_move_sans(game_state: ChessEngine.GameState, move_sans: list[str]) -> None:
+    # keep the san of every move in step with the move log, moves taken back are dropped and new ones are worked out
+    del move_sans[len(game_state.move_log):]
+    missing = game_state.move_log[len(move_sans):]
+    for _ in missing:
+        game_state.undo_move()
+    for move in missing: # san needs the legal moves of the position before the move
+        move_sans.append(ChessPgn.move_to_san(game_state, move))
+        game_state.make_move(move, promotion_choice=move.promotion_choice)
+    if missing:
+        game_state.get_valid_moves() # taking moves back clears checkmate and stalemate, work them out again
+
+def draw_move_log(screen: pygame.display, move_sans: list[str], font: pygame.font) -> None:
     move_log_rect = pygame.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
     pygame.draw.rect(screen, pygame.Color("black"), move_log_rect)
-    move_log = game_state.move_log
     move_texts = []
     
-    for i in range(0, len(move_log), 2):
+    for i in range(0, len(move_sans), 2):
         move_string = str(i // 2 + 1) + "."  # start with the move number
-        move_string += " " + str(move_log[i])  # add white's move
-        if i + 1 < len(move_log):  # Ensure black made a move
-            move_string += " " + str(move_log[i + 1])  # add black's move
+        move_string += " " + move_sans[i]  # add white's move
+        if i + 1 < len(move_sans):  # Ensure black made a move
+            move_string += " " + move_sans[i + 1]  # add black's move
         move_texts.append(move_string)
 
     # columns and rows
@@ -108,11 +125,11 @@ def draw_move_log(screen: pygame.display, game_state: ChessEngine.GameState, fon
             text_x += column_spacing  # move to next column
             text_y = padding  # reset Y position for new column
 
-def draw_game_state(screen: pygame.display, game_state: ChessEngine.GameState, valid_moves: list[ChessEngine.Move], square_selected: tuple[int, int], move_log_font: pygame.font, last_move: ChessEngine.Move = None) -> None:
+def draw_game_state(screen: pygame.display, game_state: ChessEngine.GameState, valid_moves: list[ChessEngine.Move], square_selected: tuple[int, int], move_log_font: pygame.font, move_sans: list[str], last_move: ChessEngine.Move = None) -> None:
     draw_board(screen)
     highlight_squares(screen, game_state, valid_moves, square_selected, last_move)
     draw_pieces(screen, game_state.board)
-    draw_move_log(screen, game_state, move_log_font)
+    draw_move_log(screen, move_sans, move_log_font)
 
 def animate_move(move: ChessEngine.Move, screen: pygame.display, board: list[list[str]], clock: pygame.time.Clock) -> None:
     global colors
@@ -254,7 +271,20 @@ def main_menu() -> None:
     # Return the selected result
     return result["player1"], result["player2"]
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="PyChess: The Greatest Kinda Okay Python Chess Engine")
+    parser.add_argument("--hash-mb", type=int, default=64, help="transposition table size for the ai, in megabytes")
+    parser.add_argument("--threads", type=int, default=1, help="search processes for the ai, more than 1 runs a lazy smp search")
+    parser.add_argument("--movetime", type=int, default=None, help="milliseconds the ai thinks per move, searches to a fixed depth if not given")
+    parser.add_argument("--book", default=None, help="polyglot opening book (.bin) for the ai, see book.py")
+    parser.add_argument("--book-random", action="store_true", help="pick book moves at random by weight instead of always the most played")
+    parser.add_argument("--tablebases", default=None, help="folder of endgame tablebases for the ai, see tablebase.py")
+    parser.add_argument("--load", default=None, help="pgn file to carry on from, the first game in it is played out on the board")
+    parser.add_argument("--save", default="games.pgn", help="pgn file the game is appended to when \"s\" is pressed")
+    return parser.parse_args()
+
 def main() -> None:
+    args = parse_args()
     player1, player2 = main_menu()
 
     pygame.mixer.init()
@@ -270,18 +300,24 @@ def main() -> None:
     move_log_font = pygame.font.SysFont("Jetbrains Mono", 19, False, False)
     clock = pygame.time.Clock()
     screen.fill(pygame.Color("white"))
-    game_state = ChessEngine.GameState()
+    game_state = Bitboard.BitboardGameState()
+    if args.load:
+        with open(args.load, encoding="utf-8", errors="replace") as pgn_file:
+            _, game_state = next(ChessPgn.replay_games(pgn_file, Bitboard.BitboardGameState), (None, game_state))
     valid_moves = game_state.get_valid_moves()
+    move_sans = [] # san of every move in the move log, for the move log panel
     move_made = False # flag var for when a move is made
     animate = False # flag var for when to animate
     running = True
     square_selected = () # keep track of last click of user (tuple: (row, column))
     player_clicks = [] # keep track of clicks user made (list of up to two tuples: [(r1, c1), (r2, c2)])
     is_game_over = False
-    chess_ai = ChessBot.NegamaxBot()
+    book = OpeningBook(args.book, random_choice=args.book_random) if args.book else None
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    chess_ai = ChessBot.NegamaxBot(hash_mb=args.hash_mb, movetime=args.movetime, threads=args.threads, book=book, tablebases=tablebases)
+    ai_worker = SearchWorker(chess_ai) # one search process for the whole game, keeps the ai's tables between moves
     last_move = None
     ai_thinking = False
-    move_finder_process = None
     move_undone = False
 
     
@@ -335,13 +371,21 @@ def main() -> None:
                     is_game_over = False
 
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        ai_worker.stop()
                         ai_thinking = False
 
                     move_undone = True
 
+                if event.key == pygame.K_s: # append the game to the pgn file when key "s" is pressed
+                    headers = {"Event": "PyChess game", "Site": "PyChess", "Date": date.today().strftime("%Y.%m.%d"),
+                               "White": "Human" if player1 else "PyChess", "Black": "Human" if player2 else "PyChess"}
+                    with open(args.save, "a") as pgn_file:
+                        pgn_file.write(ChessPgn.write_game(game_state, headers))
+                    valid_moves = game_state.get_valid_moves()
+                    print(f"Saved Game To {args.save}")
+
                 if event.key == pygame.K_r: # reset board when key "r" pressed
-                    game_state = ChessEngine.GameState()
+                    game_state = Bitboard.BitboardGameState()
                     valid_moves = game_state.get_valid_moves()
                     square_selected = ()
                     player_clicks = []
@@ -351,8 +395,9 @@ def main() -> None:
                     animate = False
 
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        ai_worker.stop()
                         ai_thinking = False
+                    ai_worker.new_game()
 
                     move_undone = True
 
@@ -361,13 +406,11 @@ def main() -> None:
             if not ai_thinking:
                 ai_thinking = True
                 print("Thinking Of Move...")
-                return_queue = Queue() # used to pass data between threads
-                move_finder_process = Process(target=chess_ai.find_best_move, args=(game_state, valid_moves, return_queue))
-                move_finder_process.start() # calls find_best_move(game_state, valid_moves, return_queue)
-            
-            if not move_finder_process.is_alive():
-                print("Finished Thinking")
-                ai_move = return_queue.get()
+                ai_worker.start_search(game_state) # sends the moves played since the last search, then starts thinking
+
+            if ai_worker.search_finished():
+                print("Finished Thinking, pv " + " ".join(move.get_uci_notation() for move in ai_worker.result_pv))
+                ai_move = ai_worker.result
                 if ai_move is None:
                     ai_move = ChessBot.RandomBot().find_random_move(valid_moves)
                     ai_move.promotion_choice = ChessBot.RandomBot().choose_random_promotion_piece()
@@ -389,7 +432,8 @@ def main() -> None:
             move_undone = False
 
         # update screen before checkmate/stalemate handling
-        draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font, last_move)
+        update_move_sans(game_state, move_sans)
+        draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font, move_sans, last_move)
         pygame.display.flip()
 
         if not is_game_over:
@@ -412,14 +456,8 @@ def main() -> None:
                 is_game_over = True
                 SOUNDS["game_end"].play()
                 if game_state.checkmate:
-                    if game_state.move_log:
-                        last_move = game_state.move_log[-1]
-                        last_move_str = str(last_move)
-                        edited_last_move = last_move_str[:-1] + "#"
-                        game_state.move_log[-1] = edited_last_move
-                    
                     # render the board before opening the checkmate window
-                    draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font, last_move)
+                    draw_game_state(screen, game_state, valid_moves, square_selected, move_log_font, move_sans, last_move)
                     pygame.display.flip()
                     pygame.time.delay(50)  # allow the board update to be visible
                     
@@ -432,5 +470,7 @@ def main() -> None:
 
         clock.tick(MAX_FPS)
 
+    ai_worker.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import argparse
+import sys
+import time
+from engine import GameState, START_FEN
+from bitboard import BitboardGameState
+
+# standard positions with published node counts (promotions count as four moves)
+PERFT_SUITE = [
+    ("start position", START_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", {1: 48, 2: 2039, 3: 97862}),
+    ("rook endgame, enpassant pins", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191, 3: 2812, 4: 43238}),
+    ("promotions and castling", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", {1: 6, 2: 264, 3: 9467}),
+    ("underpromotion checks", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", {1: 44, 2: 1486, 3: 62379}),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", {1: 46, 2: 2079, 3: 89890}),
+    ("enpassant discovered check", "8/8/8/2k5/2pP4/8/B7/4K3 b - d3 0 3", {1: 8, 2: 72, 3: 492, 4: 5380}),
+    ("enpassant evasion", "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1", {1: 6, 2: 136, 3: 863, 4: 20471}),
+    ("promotion race", "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1", {1: 24, 2: 496, 3: 9483}),
+]
+
+ENGINES = {"array": GameState, "bitboard": BitboardGameState}
+
+def promotion_choices(move):
+    return ("Q", "R", "B", "N") if move.is_pawn_promotion else (None,)
+
+def perft(game_state, depth):
+    if depth <= 0:
+        return 1 # the position itself
+    moves = game_state.get_valid_moves()
+    if depth == 1:
+        return sum(4 if move.is_pawn_promotion else 1 for move in moves)
+
+    nodes = 0
+    for move in moves:
+        for choice in promotion_choices(move):
+            game_state.make_move(move, promotion_choice=choice)
+            nodes += perft(game_state, depth - 1)
+            game_state.undo_move()
+    return nodes
+
+def divide(game_state, depth):
+    # node count below each root move, useful for bisecting a wrong total against a reference engine
+    counts = {}
+    for move in game_state.get_valid_moves():
+        for choice in promotion_choices(move):
+            game_state.make_move(move, promotion_choice=choice)
+            name = move.get_uci_notation() + (choice.lower() if choice else "")
+            counts[name] = perft(game_state, depth - 1) if depth > 1 else 1
+            game_state.undo_move()
+    return counts
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def report(nodes, elapsed):
+    nps = nodes / elapsed if elapsed > 0 else 0
+    return f"nodes {nodes}  time {elapsed:.2f}s  nps {nps:,.0f}"
+
+def run_suite(engine, max_depth):
+    failures = 0
+    total_nodes = 0
+    total_time = 0
+    for name, fen, expected in PERFT_SUITE:
+        for depth, expected_nodes in sorted(expected.items()):
+            if depth > max_depth:
+                break
+            nodes, elapsed = timed(perft, engine.from_fen(fen), depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected_nodes else f"FAIL (expected {expected_nodes})"
+            if nodes != expected_nodes:
+                failures += 1
+            print(f"{name:<30} depth {depth}  {report(nodes, elapsed)}  {status}")
+    print(f"total {report(total_nodes, total_time)}  failures {failures}")
+    return failures
+
+def depth_argument(value):
+    depth = int(value)
+    if depth < 0:
+        raise argparse.ArgumentTypeError(f"depth can't be negative: {value}")
+    return depth
+
+def main():
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the legal move tree.")
+    parser.add_argument("--depth", type=depth_argument, default=3)
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--divide", action="store_true", help="print node counts below each root move")
+    parser.add_argument("--suite", action="store_true", help="run the reference positions up to --depth")
+    parser.add_argument("--engine", choices=ENGINES, default="bitboard")
+    parser.add_argument("--check-eval", action="store_true", help="recompute the evaluation after every move and fail on a mismatch with the incremental one")
+    args = parser.parse_args()
+
+    GameState.debug_eval = args.check_eval
+
+    engine = ENGINES[args.engine]
+    if args.suite:
+        sys.exit(1 if run_suite(engine, args.depth) else 0)
+
+    game_state = engine.from_fen(args.fen)
+    if args.divide:
+        counts, elapsed = timed(divide, game_state, args.depth)
+        for name in sorted(counts):
+            print(f"{name}: {counts[name]}")
+        print(report(sum(counts.values()), elapsed))
+    else:
+        nodes, elapsed = timed(perft, game_state, args.depth)
+        print(report(nodes, elapsed))
+
+if __name__ == "__main__":
+    main()
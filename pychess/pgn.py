@@ -0,0 +1,208 @@
+import re
+from engine import START_FEN
+
+# pgn reading, read_games is a generator so a collection of any size is streamed one game at a time
+# movetext is reduced to the mainline san moves, comments, variations and nags are skipped
+
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|[^\s(){};]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+def read_games(stream):
+    # yields (headers, sans) for each game in a text stream, e.g. an open .pgn file
+    headers = {}
+    movetext = []
+    for line in stream:
+        line = line.strip()
+        if line.startswith("["):
+            match = TAG_PATTERN.match(line)
+            # tags after movetext start the next game, and so does an Event tag after tags, for games without movetext
+            if movetext or (headers and match and match.group(1) == "Event"):
+                yield finish_game(headers, movetext)
+                headers, movetext = {}, []
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith("%"): # % lines are escapes, ignored by the standard
+            movetext.append(line)
+    if headers or movetext:
+        yield finish_game(headers, movetext)
+
+def finish_game(headers, movetext):
+    sans, result = parse_movetext("\n".join(movetext))
+    if result is not None and "Result" not in headers:
+        headers["Result"] = result
+    return headers, sans
+
+def parse_movetext(text):
+    # mainline moves and the result token of one game's movetext
+    sans = []
+    result = None
+    variation_depth = 0
+    for token in TOKEN_PATTERN.findall(text):
+        if token == "(":
+            variation_depth += 1
+        elif token == ")":
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth or token[0] in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = MOVE_NUMBER_PATTERN.sub("", token) # "1." and "1..." on their own, or glued to the move as in "1.e4"
+            if token:
+                sans.append(token)
+    return sans, result
+
+def parse_san(game_state, san, valid_moves=None):
+    # the legal move in game_state that san stands for, None if it is illegal, ambiguous or unreadable
+    if valid_moves is None:
+        valid_moves = game_state.get_valid_moves()
+    san = san.rstrip("+#!?")
+
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingside = len(san) == 3
+        for move in valid_moves:
+            if move.is_castle_move and (move.end_column == 6) == kingside:
+                return move
+        return None
+
+    promotion = None
+    if "=" in san:
+        san, promotion = san.split("=", 1)
+    elif len(san) > 2 and san[0] in "abcdefgh" and san[-1] in "QRBN": # promotion without the "=", e.g. e8Q
+        san, promotion = san[:-1], san[-1]
+
+    piece = san[0] if san[0] in "KQRBN" else "P"
+    body = (san[1:] if piece != "P" else san).replace("x", "").replace("-", "").replace(":", "")
+    if len(body) < 2 or body[-2] not in "abcdefgh" or body[-1] not in "12345678":
+        return None
+    end_square = (8 - int(body[-1]), "abcdefgh".index(body[-2]))
+    hint = body[:-2] # disambiguation file and/or rank, and the file a pawn captures from
+
+    candidates = []
+    for move in valid_moves:
+        if move.piece_moved[1] != piece or move.end_square != end_square:
+            continue
+        if any((char in "abcdefgh" and move.start_column != "abcdefgh".index(char)) or (char in "12345678" and move.start_row != 8 - int(char)) for char in hint):
+            continue
+        candidates.append(move)
+
+    if len(candidates) != 1:
+        return None
+    move = candidates[0]
+    if move.is_pawn_promotion:
+        move.promotion_choice = promotion[0].upper() if promotion else "Q"
+    return move
+
+def replay_moves(game_state, sans):
+    # yields the move of each san just before it is made on game_state, stops at the first one that can't be followed
+    for san in sans:
+        move = parse_san(game_state, san)
+        if move is None:
+            return
+        yield move
+        game_state.make_move(move, promotion_choice=move.promotion_choice)
+
+def replay_games(stream, game_state_class):
+    # yields (headers, game_state) for each game in stream with its mainline played out on a new game_state_class
+    for headers, sans in read_games(stream):
+        game_state = game_state_class.from_fen(headers.get("FEN", START_FEN))
+        for _ in replay_moves(game_state, sans):
+            pass
+        yield headers, game_state
+
+# pgn writing
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+LINE_LENGTH = 80
+
+def format_game(headers, sans, result):
+    # one game as pgn text, the seven tag roster first with "?" for missing tags, movetext wrapped at LINE_LENGTH
+    headers = dict(headers, Result=result)
+    lines = [f'[{tag} "{headers.get(tag, "?")}"]' for tag in SEVEN_TAG_ROSTER]
+    lines += [f'[{tag} "{value}"]' for tag, value in headers.items() if tag not in SEVEN_TAG_ROSTER]
+    lines.append("")
+
+    tokens = []
+    first_ply = 0 # counted from the start of the game, so a game from a fen keeps its move numbers
+    if "FEN" in headers:
+        fields = headers["FEN"].split()
+        first_ply = 2 * (int(fields[5]) - 1 if len(fields) > 5 else 0) + (fields[1] == "b")
+    for ply, san in enumerate(sans, first_ply):
+        if ply % 2 == 0:
+            tokens.append(f"{ply // 2 + 1}.")
+        elif ply == first_ply:
+            tokens.append(f"{ply // 2 + 1}...")
+        tokens.append(san)
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+def move_to_san(game_state, move, valid_moves=None):
+    # san of a legal move in game_state, disambiguated against the other legal moves, with + or # from playing it out
+    if valid_moves is None:
+        valid_moves = game_state.get_valid_moves()
+
+    if move.is_castle_move:
+        san = "O-O" if move.end_column == 6 else "O-O-O"
+    else:
+        end_square = move.get_rank_file(move.end_row, move.end_column)
+        piece = move.piece_moved[1]
+        if piece == "P":
+            san = (move.columns_to_files[move.start_column] + "x" if move.is_capture else "") + end_square
+            if move.is_pawn_promotion:
+                san += "=" + (move.promotion_choice or "Q")
+        else:
+            # the file if it tells the pieces apart, otherwise the rank, otherwise both
+            rivals = [other for other in valid_moves if other.piece_moved == move.piece_moved and other.end_square == move.end_square and other.start_square != move.start_square]
+            hint = ""
+            if rivals:
+                if all(other.start_column != move.start_column for other in rivals):
+                    hint = move.columns_to_files[move.start_column]
+                elif all(other.start_row != move.start_row for other in rivals):
+                    hint = move.rows_to_ranks[move.start_row]
+                else:
+                    hint = move.get_rank_file(move.start_row, move.start_column)
+            san = piece + hint + ("x" if move.is_capture else "") + end_square
+
+    game_state.make_move(move, promotion_choice=(move.promotion_choice or "Q") if move.is_pawn_promotion else None)
+    game_state.get_valid_moves()
+    if game_state.checkmate:
+        san += "#"
+    elif game_state.in_check:
+        san += "+"
+    game_state.undo_move()
+    return san
+
+def game_result(game_state):
+    # "1-0", "0-1", "1/2-1/2" once the game in game_state is over, "*" while it is still going
+    game_state.get_valid_moves()
+    if game_state.checkmate:
+        return "0-1" if game_state.white_to_move else "1-0"
+    if game_state.stalemate or game_state.check_for_insufficient_material() or game_state.check_for_threefold_repetition() or game_state.check_for_fifty_move_rule():
+        return "1/2-1/2"
+    return "*"
+
+def write_game(game_state, headers=None, result=None):
+    # the move log of game_state as pgn text, taken back to the start position and replayed for the san of every move
+    moves = list(game_state.move_log)
+    for _ in moves:
+        game_state.undo_move()
+    headers = dict(headers or {})
+    start_fen = game_state.to_fen()
+    if start_fen != START_FEN:
+        headers.update(SetUp="1", FEN=start_fen)
+
+    sans = []
+    for move in moves:
+        sans.append(move_to_san(game_state, move))
+        game_state.make_move(move, promotion_choice=move.promotion_choice)
+    return format_game(headers, sans, result or game_result(game_state))
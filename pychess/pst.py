@@ -109,4 +109,139 @@ black_queen_pst = np.array([
     [1, 4, 3, 3, 3, 4, 2, 1],
     [1, 2, 3, 3, 3, 1, 1, 1],
     [1, 1, 1, 3, 1, 1, 1, 1]
-])
\ No newline at end of file
+])
+# king tables, the middlegame one keeps the king tucked away behind its pawns
+white_king_pst = np.array([
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [1, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 0, 0, 1, 1, 1],
+    [3, 3, 2, 1, 1, 2, 3, 3],
+    [3, 4, 3, 1, 1, 2, 4, 3]
+])
+
+black_king_pst = np.flipud(white_king_pst)
+
+# endgame tables, the tables above are used for the middlegame
+# pawns are worth more the closer they get to promoting and the king and minor pieces belong in the center
+white_pawn_eg_pst = np.array([
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [10, 10, 10, 10, 10, 10, 10, 10],
+    [7, 7, 7, 7, 7, 7, 7, 7],
+    [5, 5, 5, 5, 5, 5, 5, 5],
+    [3, 3, 3, 3, 3, 3, 3, 3],
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [0, 0, 0, 0, 0, 0, 0, 0]
+])
+
+white_knight_eg_pst = np.array([
+    [0, 1, 1, 1, 1, 1, 1, 0],
+    [1, 1, 2, 2, 2, 2, 1, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 1, 2, 2, 2, 2, 1, 1],
+    [0, 1, 1, 1, 1, 1, 1, 0]
+])
+
+white_bishop_eg_pst = np.array([
+    [1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1]
+])
+
+white_rook_eg_pst = np.array([
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [3, 3, 3, 3, 3, 3, 3, 3],
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [2, 2, 2, 2, 2, 2, 2, 2],
+    [2, 2, 2, 2, 2, 2, 2, 2]
+])
+
+white_queen_eg_pst = np.array([
+    [0, 1, 1, 1, 1, 1, 1, 0],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [0, 1, 1, 1, 1, 1, 1, 0]
+])
+
+white_king_eg_pst = np.array([
+    [0, 1, 1, 1, 1, 1, 1, 0],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 4, 4, 3, 2, 1],
+    [1, 2, 3, 3, 3, 3, 2, 1],
+    [1, 2, 2, 2, 2, 2, 2, 1],
+    [0, 1, 1, 1, 1, 1, 1, 0]
+])
+
+# black's endgame tables are white's seen from the other side of the board
+black_pawn_eg_pst = np.flipud(white_pawn_eg_pst)
+black_knight_eg_pst = np.flipud(white_knight_eg_pst)
+black_bishop_eg_pst = np.flipud(white_bishop_eg_pst)
+black_rook_eg_pst = np.flipud(white_rook_eg_pst)
+black_queen_eg_pst = np.flipud(white_queen_eg_pst)
+black_king_eg_pst = np.flipud(white_king_eg_pst)
+
+# the tables stacked by piece code, in the order of engine.PIECE_INDEX (wP wR wN wB wQ wK bP bR bN bB bQ bK), row 12 is the empty square
+# each row is its table flattened to the square indexes row * 8 + column
+def stack_tables(tables):
+    stack = np.zeros((13, 64))
+    for piece_code, table in enumerate(tables):
+        stack[piece_code] = table.ravel()
+    return stack
+
+MG_PST_STACK = stack_tables([
+    white_pawn_pst, white_rook_pst, white_knight_pst, white_bishop_pst, white_queen_pst, white_king_pst,
+    black_pawn_pst, black_rook_pst, black_knight_pst, black_bishop_pst, black_queen_pst, black_king_pst
+])
+EG_PST_STACK = stack_tables([
+    white_pawn_eg_pst, white_rook_eg_pst, white_knight_eg_pst, white_bishop_eg_pst, white_queen_eg_pst, white_king_eg_pst,
+    black_pawn_eg_pst, black_rook_eg_pst, black_knight_eg_pst, black_bishop_eg_pst, black_queen_eg_pst, black_king_eg_pst
+])
+
+PST_WEIGHT = 0.35
+PIECE_VALUES = np.array([1, 5, 2.9, 3.1, 9, 0, 1, 5, 2.9, 3.1, 9, 0, 0]) # kings are never traded, so they score nothing
+PIECE_SIGNS = np.array([1] * 6 + [-1] * 6 + [0])
+
+# material plus weighted pst from white's point of view, one row per piece code
+MG_TABLE = PIECE_SIGNS[:, None] * (PIECE_VALUES[:, None] + PST_WEIGHT * MG_PST_STACK)
+EG_TABLE = PIECE_SIGNS[:, None] * (PIECE_VALUES[:, None] + PST_WEIGHT * EG_PST_STACK)
+SQUARES = np.arange(64)
+
+# game phase counts the pieces left, TOTAL_PHASE with all of them on the board down to 0 with only kings and pawns
+PHASE_WEIGHTS = np.array([0, 2, 1, 1, 4, 0, 0, 2, 1, 1, 4, 0, 0])
+TOTAL_PHASE = 24
+
+def taper(mg_score, eg_score, phase):
+    # blend of the middlegame and endgame scores, promotions can push phase past TOTAL_PHASE
+    phase = min(phase, TOTAL_PHASE)
+    return (mg_score * phase + eg_score * (TOTAL_PHASE - phase)) / TOTAL_PHASE
+
+def evaluate_piece_codes(piece_codes):
+    # a GameState.piece_codes board in, its score out
+    return taper(float(MG_TABLE[piece_codes, SQUARES].sum()), float(EG_TABLE[piece_codes, SQUARES].sum()), int(PHASE_WEIGHTS[piece_codes].sum()))
+
+def evaluate_batch(piece_code_boards):
+    # (n, 64) boards in, (n,) scores out
+    phases = np.minimum(PHASE_WEIGHTS[piece_code_boards].sum(axis=1), TOTAL_PHASE)
+    mg_scores = MG_TABLE[piece_code_boards, SQUARES].sum(axis=1)
+    eg_scores = EG_TABLE[piece_code_boards, SQUARES].sum(axis=1)
+    return (mg_scores * phases + eg_scores * (TOTAL_PHASE - phases)) / TOTAL_PHASE
@@ -0,0 +1,186 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from bitboard import BitboardGameState
+from engine import START_FEN
+from bot import NegamaxBot, MinimaxBot, GreedyBot, RandomBot
+from pgn import format_game, move_to_san
+
+# headless bot vs bot games over a process pool, for measuring strength and speed without the gui
+#   python selfplay.py --games 1000 --workers 16 --white negamax --black greedy
+# every finished game is appended to the results file (json lines) and the pgn file straight away,
+# so a long run can be watched or cut short without losing what's been played
+
+PLAYERS = ("negamax", "minimax", "greedy", "random")
+MAX_PLIES = 400 # games still going after this many plies are adjudicated drawn
+
+# the players of the current worker process, made once by init_worker and reused for every game it plays
+worker_players = None
+
+def create_player(name, options):
+    if name == "negamax":
+        player = NegamaxBot(hash_mb=options["hash_mb"], movetime=options["movetime"])
+        player.verbose = False
+        if options["depth"] is not None:
+            player.max_depth = options["depth"]
+        return player
+    if name == "minimax":
+        return MinimaxBot()
+    if name == "greedy":
+        return GreedyBot()
+    return RandomBot()
+
+def init_worker(names, options):
+    global worker_players
+    worker_players = {name: create_player(name, options) for name in set(names)}
+
+def choose_move(player, game_state, valid_moves):
+    # (move, nodes searched), every bot gets a fresh list since some of them shuffle it
+    nodes = 0
+    if isinstance(player, RandomBot):
+        move = player.find_random_move(valid_moves)
+    else:
+        move = player.find_best_move(game_state, list(valid_moves))
+        if isinstance(player, NegamaxBot):
+            nodes = player.search_nodes
+    if move is None:
+        move = random.choice(valid_moves)
+    if move.is_pawn_promotion and move.promotion_choice is None:
+        move.promotion_choice = "Q"
+    return move, nodes
+
+def play_game(game_index, white, black, fen, random_plies, seed, max_plies=MAX_PLIES):
+    # plays one game in a worker process and returns its record, random_plies random moves first so games differ
+    random.seed(seed + game_index)
+    players = {True: worker_players[white], False: worker_players[black]}
+    for player in players.values():
+        if isinstance(player, NegamaxBot):
+            player.new_game() # games stay independent of the order the worker played them in
+
+    game_state = BitboardGameState.from_fen(fen)
+    sans = []
+    nodes = 0
+    search_time = 0
+    result, termination = "1/2-1/2", "max plies"
+    for ply in range(max_plies):
+        valid_moves = game_state.get_valid_moves()
+        if game_state.checkmate:
+            result, termination = ("0-1" if game_state.white_to_move else "1-0"), "checkmate"
+            break
+        if game_state.stalemate:
+            termination = "stalemate"
+            break
+        if game_state.check_for_insufficient_material():
+            termination = "insufficient material"
+            break
+        if game_state.check_for_threefold_repetition():
+            termination = "threefold repetition"
+            break
+        if game_state.check_for_fifty_move_rule():
+            termination = "fifty move rule"
+            break
+
+        start = time.perf_counter()
+        if ply < random_plies:
+            move, move_nodes = random.choice(valid_moves), 0
+            if move.is_pawn_promotion:
+                move.promotion_choice = "Q"
+        else:
+            move, move_nodes = choose_move(players[game_state.white_to_move], game_state, valid_moves)
+        search_time += time.perf_counter() - start
+        nodes += move_nodes
+        sans.append(move_to_san(game_state, move, valid_moves))
+        game_state.make_move(move, promotion_choice=move.promotion_choice)
+
+    return {
+        "game": game_index, "white": white, "black": black, "result": result, "termination": termination,
+        "plies": len(sans), "nodes": nodes, "time": round(search_time, 3), "fen": fen, "moves": sans
+    }
+
+def score_of(record, player):
+    # points for player from a finished game record, 1 win, 0.5 draw, 0 loss
+    if record["result"] == "1/2-1/2":
+        return 0.5
+    white_won = record["result"] == "1-0"
+    return 1.0 if white_won == (record["white"] == player) else 0.0
+
+def elo_difference(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def elo_estimate(wins, draws, losses):
+    # elo difference and its 95% error margin, from the mean and spread of the per game scores
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo_difference(score), (elo_difference(score + margin) - elo_difference(score - margin)) / 2
+
+def format_standings(name, wins, draws, losses):
+    elo, margin = elo_estimate(wins, draws, losses)
+    return f"{name} W/D/L {wins}/{draws}/{losses}  elo {elo:+.0f} +/- {margin:.0f}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Play bot vs bot games without the gui.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="games played at the same time, one process each")
+    parser.add_argument("--white", choices=PLAYERS, default="negamax")
+    parser.add_argument("--black", choices=PLAYERS, default="greedy")
+    parser.add_argument("--swap", action="store_true", help="swap colors every other game, results are still given for --white's player")
+    parser.add_argument("--depth", type=int, default=None, help="negamax search depth, defaults to the bot's max_depth")
+    parser.add_argument("--movetime", type=int, default=None, help="negamax milliseconds per move instead of a fixed depth")
+    parser.add_argument("--hash-mb", type=int, default=16, help="transposition table per negamax player, in every worker")
+    parser.add_argument("--fen", default=START_FEN, help="position every game starts from")
+    parser.add_argument("--random-plies", type=int, default=2, help="random moves played at the start of every game so they differ")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="adjudicate a draw after this many plies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default="selfplay.jsonl", help="game records, one json object per line")
+    parser.add_argument("--pgn", default="selfplay.pgn")
+    args = parser.parse_args()
+
+    options = {"hash_mb": args.hash_mb, "movetime": args.movetime, "depth": args.depth}
+    player = args.white
+    wins = draws = losses = 0
+    total_nodes = 0
+    start = time.perf_counter()
+    with open(args.results, "w") as results_file, open(args.pgn, "w") as pgn_file, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=((args.white, args.black), options)) as pool:
+        futures = []
+        for game_index in range(args.games):
+            white, black = (args.black, args.white) if args.swap and game_index % 2 else (args.white, args.black)
+            futures.append(pool.submit(play_game, game_index, white, black, args.fen, args.random_plies, args.seed, args.max_plies))
+
+        for finished, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            score = score_of(record, player)
+            wins += score == 1.0
+            draws += score == 0.5
+            losses += score == 0.0
+            total_nodes += record["nodes"]
+
+            results_file.write(json.dumps(record) + "\n")
+            results_file.flush()
+            headers = {"Event": "selfplay", "Site": "pychess", "Date": date.today().strftime("%Y.%m.%d"), "Round": record["game"] + 1,
+                       "White": record["white"], "Black": record["black"], "Termination": record["termination"]}
+            if record["fen"] != START_FEN:
+                headers.update(SetUp="1", FEN=record["fen"])
+            pgn_file.write(format_game(headers, record["moves"], record["result"]))
+            pgn_file.flush()
+
+            elapsed = time.perf_counter() - start
+            print(f"game {finished}/{args.games}  {record['white']} vs {record['black']} {record['result']} ({record['termination']}, {record['plies']} plies)  "
+                  f"{format_standings(player, wins, draws, losses)}  nps {total_nodes / elapsed:,.0f}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{format_standings(player, wins, draws, losses)}")
+    print(f"{args.games} games in {elapsed:.1f}s, {total_nodes} nodes, {total_nodes / elapsed:,.0f} nodes per second over {args.workers} workers")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+import argparse
+import os
+import time
+import numpy as np
+from engine import PIECE_NAMES
+from bitboard import BitboardGameState
+
+# endgame tablebases for up to 4 pieces (kings included), built by retrograde analysis
+# every position of a material set gets an index, side << 6n | square of piece 0 << 6(n-1) | ... | square of piece n-1,
+# with the pieces in a fixed order, white then black and K Q R B N P within a color
+# tables only exist for the stronger side as white, KvKQ is looked up in KQvK with the board flipped and the colors swapped
+# each table is two numpy files in the tablebase folder, loaded memory mapped:
+#   <signature>.wdl.npy  int8, 1 win, 0 draw, -1 loss for the side to move, ILLEGAL for positions that can't happen
+#   <signature>.dtm.npy  uint8, plies to mate for wins and losses, 0 for draws
+# castling and enpassant are not part of the tables, positions where either could be played are not probed
+#   python tablebase.py generate KQvK KRvK KPvK   generate tables and the smaller ones they depend on
+#   python tablebase.py generate --all 3          every table with up to 3 pieces
+#   python tablebase.py bench KRvK --repeat 3     time generation
+#   python tablebase.py verify KPvK --samples 2000  cross check against the move generator
+
+MAX_PIECES = 4
+MAX_PHASE = 8 # the most game phase MAX_PIECES pieces can carry, two queens
+DEFAULT_DIRECTORY = "tablebases"
+PIECE_ORDER = "KQRBNP"
+STRENGTH = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+WIN, DRAW, LOSS, ILLEGAL = 1, 0, -1, -128
+
+# generation scores from the side to move, MATE - plies for a win, plies - MATE for a loss, 0 for a draw
+MATE = 1000
+NO_MOVE = -30000 # best_exit of a position without moves leaving the table
+ILLEGAL_SCORE = -32768
+CHUNK = 1 << 18 # positions per vectorized step, keeps the temporary arrays small on 4 piece tables
+
+# board geometry, OFF stands for a square off the board so lookups can chain through it
+OFF = 64
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+SLIDER_DIRECTIONS = {"Q": ROOK_DIRECTIONS + BISHOP_DIRECTIONS, "R": ROOK_DIRECTIONS, "B": BISHOP_DIRECTIONS}
+
+def offset_square(square, row_offset, column_offset):
+    row, column = square // 8 + row_offset, square % 8 + column_offset
+    return row * 8 + column if 0 <= row < 8 and 0 <= column < 8 else OFF
+
+def build_jumps(offsets):
+    # (65, 8) targets per square, padded with OFF, the OFF row keeps chained lookups off the board
+    jumps = np.full((65, 8), OFF, dtype=np.int64)
+    for square in range(64):
+        for index, (row_offset, column_offset) in enumerate(offsets):
+            jumps[square, index] = offset_square(square, row_offset, column_offset)
+    return jumps
+
+JUMPS = {"K": build_jumps(KING_OFFSETS), "N": build_jumps(KNIGHT_OFFSETS)}
+STEPS = {direction: np.array([offset_square(square, *direction) for square in range(64)] + [OFF], dtype=np.int64) for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+# pawn captures per color (0 white, 1 black), white pawns move towards row 0
+PAWN_CAPTURES = [build_jumps([(-1, -1), (-1, 1)])[:, :2], build_jumps([(1, -1), (1, 1)])[:, :2]]
+PAWN_PUSH = [-8, 8]
+PAWN_START_ROW = [6, 1]
+PROMOTION_ROW = [0, 7]
+
+def build_attack_tables():
+    # empty board attacks [attacker kind][from, to] and the squares strictly between two aligned squares as bitmasks
+    attacks = {kind: np.zeros((64, 64), dtype=bool) for kind in ("K", "N", "Q", "R", "B", "wP", "bP")}
+    between = np.zeros((64, 64), dtype=np.uint64)
+    for square in range(64):
+        for kind in ("K", "N"):
+            for target in JUMPS[kind][square]:
+                if target != OFF:
+                    attacks[kind][square, target] = True
+        for color, kind in enumerate(("wP", "bP")):
+            for target in PAWN_CAPTURES[color][square]:
+                if target != OFF:
+                    attacks[kind][square, target] = True
+        for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            passed = 0
+            target = offset_square(square, *direction)
+            while target != OFF:
+                between[square, target] = passed
+                for kind, directions in SLIDER_DIRECTIONS.items():
+                    if direction in directions:
+                        attacks[kind][square, target] = True
+                passed |= 1 << target
+                target = offset_square(target, *direction)
+    return attacks, between
+
+ATTACKS, BETWEEN = build_attack_tables()
+
+def sort_letters(letters):
+    return "".join(sorted(letters, key=PIECE_ORDER.index))
+
+def side_strength(letters):
+    return (sum(STRENGTH[letter] for letter in letters), [-PIECE_ORDER.index(letter) for letter in letters])
+
+def material_signature(white, black):
+    # the table name for a material set and whether the colors have to be swapped to look it up
+    white, black = sort_letters(white), sort_letters(black)
+    if side_strength(black) > side_strength(white):
+        return black + "v" + white, True
+    return white + "v" + black, False
+
+def table_index(pieces, squares, side):
+    # pieces [(letter, color)], squares and side as ints or numpy arrays, in whatever order and orientation
+    # returns the table signature and the index into it
+    white = "".join(letter for letter, color in pieces if color == 0)
+    black = "".join(letter for letter, color in pieces if color == 1)
+    signature, flipped = material_signature(white, black)
+    if flipped:
+        pieces = [(letter, 1 - color) for letter, color in pieces]
+        squares = [square ^ 56 for square in squares]
+        side = 1 - side
+    order = sorted(range(len(pieces)), key=lambda slot: (pieces[slot][1], PIECE_ORDER.index(pieces[slot][0])))
+    index = side << (6 * len(pieces))
+    for position, slot in enumerate(order):
+        index = index | (squares[slot] << (6 * (len(pieces) - 1 - position)))
+    return signature, index
+
+class Material:
+    def __init__(self, signature):
+        white, black = signature.split("v")
+        self.signature = signature
+        self.pieces = [(letter, 0) for letter in white] + [(letter, 1) for letter in black]
+        self.size = len(self.pieces)
+        self.positions = 2 << (6 * self.size)
+        self.kings = [self.pieces.index(("K", color)) for color in (0, 1)]
+
+    def shift(self, slot):
+        return 6 * (self.size - 1 - slot)
+
+    def decode(self, index):
+        return [(index >> self.shift(slot)) & 63 for slot in range(self.size)]
+
+    def exit_signatures(self):
+        # tables reached by a capture or a promotion, with the promotion possibly capturing too
+        signatures = set()
+        for slot, (letter, color) in enumerate(self.pieces):
+            if letter != "K":
+                remaining = self.pieces[:slot] + self.pieces[slot + 1:]
+                signatures.add(table_index(remaining, [0] * len(remaining), 0)[0])
+            if letter == "P":
+                for promoted in "QRBN":
+                    pieces = self.pieces[:slot] + [(promoted, color)] + self.pieces[slot + 1:]
+                    signatures.add(table_index(pieces, [0] * len(pieces), 0)[0])
+                    for captured, (captured_letter, captured_color) in enumerate(pieces):
+                        if captured_color != color and captured_letter != "K":
+                            remaining = pieces[:captured] + pieces[captured + 1:]
+                            signatures.add(table_index(remaining, [0] * len(remaining), 0)[0])
+        return signatures
+
+def attacked(target, attackers, occupied):
+    # whether target is attacked by any of attackers [(letter, color, squares)], occupied holds every piece's squares as uint64
+    hit = np.zeros(len(target), dtype=bool)
+    for letter, color, squares in attackers:
+        kind = ("w", "b")[color] + "P" if letter == "P" else letter
+        attack = ATTACKS[kind][squares, target]
+        if letter in SLIDER_DIRECTIONS:
+            between = BETWEEN[squares, target]
+            for other in occupied:
+                attack &= ((between >> other) & np.uint64(1)) == 0
+        hit |= attack
+    return hit
+
+def occupant(target, squares):
+    # slot of the piece on target, -1 for an empty square (and for OFF)
+    slots = np.full(len(target), -1, dtype=np.int8)
+    for slot, square in enumerate(squares):
+        slots[square == target] = slot
+    return slots
+
+def piece_targets(letter, color, square, squares):
+    # (target, occupying slot) for every move of a piece, not yet split into quiet moves and captures
+    # targets of pawn pushes are only yielded when empty, pawn captures only when occupied
+    if letter in JUMPS:
+        for index in range(8):
+            target = JUMPS[letter][square, index]
+            yield target, occupant(target, squares)
+    elif letter in SLIDER_DIRECTIONS:
+        for direction in SLIDER_DIRECTIONS[letter]:
+            target = square
+            blocked = np.zeros(len(square), dtype=bool)
+            for _ in range(7):
+                target = np.where(blocked, OFF, STEPS[direction][target])
+                slots = occupant(target, squares)
+                yield target, slots
+                blocked |= (target == OFF) | (slots != -1)
+    else:
+        one = square + PAWN_PUSH[color]
+        one_slots = occupant(one, squares)
+        yield np.where(one_slots == -1, one, OFF), one_slots
+        two = square + 2 * PAWN_PUSH[color]
+        two_slots = occupant(two, squares)
+        yield np.where((square // 8 == PAWN_START_ROW[color]) & (one_slots == -1) & (two_slots == -1), two, OFF), two_slots
+        for index in range(2):
+            target = PAWN_CAPTURES[color][square, index]
+            slots = occupant(target, squares)
+            yield np.where(slots != -1, target, OFF), slots
+
+def piece_origins(letter, color, square, squares):
+    # squares a piece could have come from without capturing, the reverse of piece_targets' quiet moves
+    if letter in JUMPS:
+        for index in range(8):
+            origin = JUMPS[letter][square, index]
+            yield np.where(occupant(origin, squares) == -1, origin, OFF)
+    elif letter in SLIDER_DIRECTIONS:
+        for direction in SLIDER_DIRECTIONS[letter]:
+            origin = square
+            for _ in range(7):
+                origin = STEPS[direction][origin]
+                origin = np.where(occupant(origin, squares) == -1, origin, OFF)
+                yield origin
+    else:
+        row = square // 8
+        one = square - PAWN_PUSH[color]
+        one_free = occupant(one, squares) == -1
+        # a pawn can't have come from its own back rank
+        yield np.where(one_free & (one // 8 != PROMOTION_ROW[1 - color]), one, OFF)
+        two = square - 2 * PAWN_PUSH[color]
+        yield np.where(one_free & (row == PAWN_START_ROW[color] + 2 * PAWN_PUSH[color] // 8) & (occupant(two, squares) == -1), two, OFF)
+
+class Generator:
+    def __init__(self, directory):
+        self.directory = directory
+        self.scores = {} # signature -> int16 scores of tables already generated or loaded, for the exits of bigger tables
+
+    def table_path(self, signature, kind):
+        return os.path.join(self.directory, f"{signature}.{kind}.npy")
+
+    def generate(self, signature, force=False):
+        # generates a table and, first, any smaller table it depends on that isn't on disk yet
+        material = Material(signature)
+        for exit_signature in material.exit_signatures():
+            if not os.path.exists(self.table_path(exit_signature, "wdl")):
+                self.generate(exit_signature)
+        if force or not os.path.exists(self.table_path(signature, "wdl")):
+            scores = self.solve(material)
+            self.save(signature, scores)
+            self.scores[signature] = scores
+        return signature
+
+    def load_scores(self, signature):
+        if signature not in self.scores:
+            wdl = np.load(self.table_path(signature, "wdl"))
+            dtm = np.load(self.table_path(signature, "dtm")).astype(np.int16)
+            scores = np.where(wdl == WIN, MATE - dtm, np.where(wdl == LOSS, dtm - MATE, 0)).astype(np.int16)
+            scores[wdl == ILLEGAL] = ILLEGAL_SCORE
+            self.scores[signature] = scores
+        return self.scores[signature]
+
+    def save(self, signature, scores):
+        os.makedirs(self.directory, exist_ok=True)
+        wdl = np.sign(scores).astype(np.int8)
+        wdl[scores == ILLEGAL_SCORE] = ILLEGAL
+        dtm = np.where(scores > 0, MATE - scores, np.where(scores < 0, scores + MATE, 0))
+        dtm[scores == ILLEGAL_SCORE] = 0
+        if dtm.max() > 255:
+            raise ValueError(f"{signature} has mates longer than 255 plies, too long for the dtm table")
+        np.save(self.table_path(signature, "wdl"), wdl)
+        np.save(self.table_path(signature, "dtm"), dtm.astype(np.uint8))
+
+    def solve(self, material):
+        valid, in_check = self.find_valid(material)
+        degree, best_exit = self.count_moves(material, valid)
+        scores = np.full(material.positions, ILLEGAL_SCORE, dtype=np.int16)
+        final = ~valid
+
+        # positions without a move inside the table are decided by their exits, or are mate or stalemate
+        stuck = valid & (degree == 0)
+        no_moves = stuck & (best_exit == NO_MOVE)
+        best_exit[no_moves & in_check] = -MATE
+        best_exit[no_moves & ~in_check] = 0
+        draws = stuck & (best_exit == 0)
+        scores[draws] = 0
+        final |= draws
+
+        # retrograde pass, level by level in plies to mate
+        # a loss at level L makes every position that can move into it a win at L + 1, a win at L takes one move
+        # away from each predecessor, which is lost at L + 1 once it has no moves left that don't lose
+        won = np.zeros(material.positions, dtype=bool) # wins found for the next level, a mask so predecessors reached twice count once
+        level = 0
+        while True:
+            exit_wins = ~final & (best_exit == MATE - level)
+            exit_losses = ~final & (degree == 0) & (best_exit == level - MATE)
+            newly = np.flatnonzero(exit_wins | exit_losses)
+            scores[newly] = best_exit[newly]
+            final[newly] = True
+            if level > 0:
+                newly = np.concatenate([newly, np.flatnonzero(won)])
+                won[:] = False
+            if len(newly) == 0 and not np.any(~final & (best_exit != NO_MOVE) & ((best_exit > 0) | (degree == 0))):
+                break
+
+            for start in range(0, len(newly), CHUNK):
+                chunk = newly[start:start + CHUNK]
+                chunk_scores = scores[chunk]
+                losses = chunk[chunk_scores < 0]
+                if len(losses):
+                    wins = self.predecessors(material, losses)
+                    wins = wins[~final[wins]]
+                    scores[wins] = MATE - (level + 1)
+                    final[wins] = True
+                    won[wins] = True
+                wins = chunk[chunk_scores > 0]
+                if len(wins):
+                    parents, counts = np.unique(self.predecessors(material, wins), return_counts=True)
+                    keep = ~final[parents]
+                    parents, counts = parents[keep], counts[keep]
+                    degree[parents] -= counts.astype(np.int8)
+                    lost = parents[degree[parents] == 0]
+                    # every move inside the table loses, the exits decide if it's a longer loss, a draw or a win
+                    best_exit[lost] = np.maximum(best_exit[lost], level + 1 - MATE)
+                    drawn = lost[best_exit[lost] == 0]
+                    scores[drawn] = 0
+                    final[drawn] = True
+            level += 1
+
+        scores[~final] = 0 # positions that never resolved can always avoid losing
+        return scores
+
+    def find_valid(self, material):
+        # a position is valid if the pieces are on distinct squares, no pawn is on a back rank and the side not to move isn't in check
+        valid = np.zeros(material.positions, dtype=bool)
+        in_check = np.zeros(material.positions, dtype=bool)
+        half = material.positions // 2
+        for start in range(0, material.positions, min(CHUNK, half)):
+            index = np.arange(start, start + min(CHUNK, half), dtype=np.int64)
+            side = start // half
+            squares = material.decode(index)
+            ok = np.ones(len(index), dtype=bool)
+            for slot, square in enumerate(squares):
+                for other in squares[slot + 1:]:
+                    ok &= square != other
+                if material.pieces[slot][0] == "P":
+                    ok &= (square >= 8) & (square < 56)
+            occupied = [square.astype(np.uint64) for square in squares]
+            attackers = [[(letter, color, squares[slot]) for slot, (letter, color) in enumerate(material.pieces) if color == attacker_color] for attacker_color in (0, 1)]
+            ok &= ~attacked(squares[material.kings[1 - side]], attackers[side], occupied)
+            valid[index] = ok
+            in_check[index] = ok & attacked(squares[material.kings[side]], attackers[1 - side], occupied)
+        return valid, in_check
+
+    def count_moves(self, material, valid):
+        # degree counts the legal moves that stay in the table, best_exit is the best score over the captures and promotions
+        degree = np.zeros(material.positions, dtype=np.int8)
+        best_exit = np.full(material.positions, NO_MOVE, dtype=np.int16)
+        half = material.positions // 2
+        side_bit = np.int64(half)
+        for start in range(0, material.positions, min(CHUNK, half)):
+            index = np.arange(start, start + min(CHUNK, half), dtype=np.int64)
+            index = index[valid[index]]
+            side = start // half
+            squares = material.decode(index)
+            chunk_degree = np.zeros(len(index), dtype=np.int8)
+            chunk_exit = np.full(len(index), NO_MOVE, dtype=np.int16)
+            for slot, (letter, color) in enumerate(material.pieces):
+                if color != side:
+                    continue
+                shift = material.shift(slot)
+                # captures and promotions leave the table, for (captured slot, promoted piece)
+                exits = [(None, promoted) for promoted in "QRBN"] if letter == "P" else []
+                for captured, (captured_letter, captured_color) in enumerate(material.pieces):
+                    if captured_color != side and captured_letter != "K":
+                        exits += [(captured, None)] + ([(captured, promoted) for promoted in "QRBN"] if letter == "P" else [])
+                for target, slots in piece_targets(letter, color, squares[slot], squares):
+                    on_board = target != OFF
+                    promotes = on_board & (target // 8 == PROMOTION_ROW[color]) if letter == "P" else np.zeros(len(target), dtype=bool)
+                    quiet = on_board & (slots == -1) & ~promotes
+                    if np.any(quiet):
+                        child = ((index[quiet] & ~np.int64(63 << shift)) | (target[quiet] << shift)) ^ side_bit
+                        chunk_degree[quiet] += valid[child]
+                    for captured, promoted in exits:
+                        moves = on_board & (slots == (-1 if captured is None else captured)) & (promotes if promoted is not None else ~promotes)
+                        if np.any(moves):
+                            values = self.exit_values(material, slot, target[moves], [square[moves] for square in squares], side, captured, promoted)
+                            chunk_exit[moves] = np.maximum(chunk_exit[moves], values)
+            degree[index] = chunk_degree
+            best_exit[index] = chunk_exit
+        return degree, best_exit
+
+    def exit_values(self, material, slot, target, squares, side, captured, promoted):
+        # scores of moves leaving the table, looked up in the smaller table they lead to, NO_MOVE where the move is illegal
+        pieces = list(material.pieces)
+        squares = list(squares)
+        squares[slot] = target
+        if promoted is not None:
+            pieces[slot] = (promoted, pieces[slot][1])
+        if captured is not None:
+            del pieces[captured]
+            del squares[captured]
+        signature, child = table_index(pieces, squares, 1 - side)
+        child_scores = self.load_scores(signature)[child].astype(np.int32)
+        return np.where(child_scores != ILLEGAL_SCORE, -child_scores + np.sign(child_scores), NO_MOVE)
+
+    def predecessors(self, material, index):
+        # positions one quiet move before each of index, with the other side to move and not yet checked for legality
+        half = material.positions // 2
+        side = index >= half
+        mover = 1 - side.astype(np.int64)
+        squares = material.decode(index & (half - 1))
+        found = []
+        for slot, (letter, color) in enumerate(material.pieces):
+            shift = material.shift(slot)
+            moved_by = mover == color
+            if not np.any(moved_by):
+                continue
+            own = index[moved_by]
+            own_squares = [square[moved_by] for square in squares]
+            for origin in piece_origins(letter, color, own_squares[slot], own_squares):
+                ok = origin != OFF
+                if np.any(ok):
+                    found.append(((own[ok] & ~np.int64(63 << shift)) | (origin[ok] << shift)) ^ np.int64(half))
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        parents = np.concatenate(found)
+        return parents
+
+class Tablebases:
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {} # signature -> (wdl, dtm), memory mapped
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".wdl.npy"):
+                    signature = name[:-len(".wdl.npy")]
+                    self.tables[signature] = (np.load(os.path.join(directory, name), mmap_mode="r"), np.load(os.path.join(directory, f"{signature}.dtm.npy"), mmap_mode="r"))
+                    self.max_pieces = max(self.max_pieces, len(signature) - 1)
+
+    def __getstate__(self):
+        # the maps don't pickle, a copy in another process maps the files again
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def probe(self, game_state):
+        # (wdl, dtm) from the side to move, None if the position isn't in a table
+        if game_state.phase > MAX_PHASE or game_state.current_castling_rights.mask:
+            return None # cheap checks first, this runs at every node of the search
+        if sum(game_state.piece_counts) > self.max_pieces:
+            return None
+        codes = game_state.piece_codes
+        if game_state.enpassant_possible:
+            # the tables don't know about enpassant, fine as long as no pawn can actually take
+            row, column = game_state.enpassant_possible
+            pawn_row, pawn_code = (row + 1, 0) if game_state.white_to_move else (row - 1, 6)
+            if any(0 <= side < 8 and codes[pawn_row * 8 + side] == pawn_code for side in (column - 1, column + 1)):
+                return None
+        pieces, squares = [], []
+        for code, piece_squares in enumerate(game_state.piece_squares):
+            for square in sorted(piece_squares): # ascending, like the tables were indexed from the board
+                pieces.append((PIECE_NAMES[code][1], 0 if code < 6 else 1))
+                squares.append(square)
+        signature, index = table_index(pieces, squares, 0 if game_state.white_to_move else 1)
+        table = self.tables.get(signature)
+        if table is None:
+            return None
+        wdl, dtm = table
+        if wdl[index] == ILLEGAL:
+            return None
+        return int(wdl[index]), int(dtm[index])
+
+def all_signatures(max_pieces):
+    # every table with up to max_pieces pieces, kings included
+    signatures = set()
+    extras = [""]
+    for _ in range(max_pieces - 2):
+        extras += [extra + letter for extra in extras for letter in PIECE_ORDER[1:]]
+    for white in set(sort_letters(extra) for extra in extras):
+        for black in set(sort_letters(extra) for extra in extras):
+            if len(white) + len(black) <= max_pieces - 2:
+                signatures.add(material_signature("K" + white, "K" + black)[0])
+    return sorted(signatures, key=lambda signature: (len(signature), signature))
+
+def position_fen(material, index):
+    half = material.positions // 2
+    board = [["1"] * 8 for _ in range(8)]
+    for (letter, color), square in zip(material.pieces, material.decode(index % half)):
+        board[square // 8][square % 8] = letter if color == 0 else letter.lower()
+    placement = "/".join("".join(row) for row in board)
+    for count in range(8, 1, -1):
+        placement = placement.replace("1" * count, str(count))
+    return f"{placement} {'b' if index >= half else 'w'} - - 0 1"
+
+def children_value(tablebases, game_state):
+    # (wdl, dtm) of a position worked out from its children's table values, None if a child can't be probed
+    valid_moves = game_state.get_valid_moves()
+    if not valid_moves:
+        return (LOSS, 0) if game_state.checkmate else (DRAW, 0)
+    best_key, best = None, None
+    for move in valid_moves:
+        for promotion in ("QRBN" if move.is_pawn_promotion else [None]):
+            game_state.make_move(move, promotion_choice=promotion)
+            child = tablebases.probe(game_state)
+            game_state.undo_move()
+            if child is None:
+                return None # an enpassant capture is possible, the tables don't follow those
+            value = (-child[0], child[1] + 1 if child[0] != DRAW else 0)
+            key = (value[0], -value[1] if value[0] == WIN else value[1]) # wins prefer the quickest mate, losses the slowest
+            if best_key is None or key > best_key:
+                best_key, best = key, value
+    return best
+
+def verify(signature, directory, samples):
+    # checks random positions against the move generator, every position's value has to follow from its children's
+    tablebases = Tablebases(directory)
+    material = Material(signature)
+    wdl, dtm = tablebases.tables[signature]
+    candidates = np.flatnonzero(np.asarray(wdl) != ILLEGAL)
+    errors = 0
+    checked = 0
+    for index in candidates[np.random.randint(0, len(candidates), samples)]:
+        fen = position_fen(material, int(index))
+        expected = (int(wdl[index]), int(dtm[index]))
+        actual = children_value(tablebases, BitboardGameState.from_fen(fen))
+        if actual is None:
+            continue
+        checked += 1
+        if actual != expected:
+            errors += 1
+            print(f"mismatch {fen}: table {expected}, children give {actual}")
+    print(f"{signature}: checked {checked} positions, {errors} mismatches")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate, benchmark and verify endgame tablebases.")
+    parser.add_argument("command", choices=["generate", "bench", "verify"])
+    parser.add_argument("signatures", nargs="*", help="material sets, e.g. KQvK KRvK KPvK")
+    parser.add_argument("--all", type=int, default=None, help="every table with up to this many pieces")
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    parser.add_argument("--repeat", type=int, default=1, help="bench, generations per table")
+    parser.add_argument("--samples", type=int, default=1000, help="verify, random positions checked per table")
+    args = parser.parse_args()
+
+    signatures = [material_signature(*signature.upper().split("V"))[0] for signature in args.signatures]
+    if args.all is not None:
+        signatures += all_signatures(min(args.all, MAX_PIECES))
+    if any(len(signature) - 1 > MAX_PIECES for signature in signatures):
+        parser.error(f"tables have at most {MAX_PIECES} pieces")
+
+    generator = Generator(args.directory)
+    if args.command == "generate":
+        for signature in signatures:
+            start = time.perf_counter()
+            generator.generate(signature)
+            print(f"{signature} done in {time.perf_counter() - start:.2f}s")
+    elif args.command == "bench":
+        for signature in signatures:
+            generator.generate(signature) # the smaller tables are loaded, not timed
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                generator.generate(signature, force=True)
+                times.append(time.perf_counter() - start)
+            positions = Material(signature).positions
+            print(f"{signature:<8} positions {positions:<10} best {min(times):.2f}s  {positions / min(times):,.0f} positions/s")
+    else:
+        errors = sum(verify(signature, args.directory, args.samples) for signature in signatures)
+        if errors:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
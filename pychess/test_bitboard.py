@@ -0,0 +1,35 @@
+import pytest
+from engine import GameState
+from bitboard import BitboardGameState
+from perft import PERFT_SUITE, promotion_choices
+
+DEPTH = 2
+
+def signature(moves):
+    return sorted((move.move_id, move.is_enpassant_move, move.is_castle_move, move.is_pawn_promotion, move.is_check) for move in moves)
+
+def perft_compare(array_state, bitboard_state, depth):
+    # walks both generators in lockstep over every promotion choice, fails on the first position where they disagree
+    array_moves = array_state.get_valid_moves()
+    bitboard_moves = bitboard_state.get_valid_moves()
+    line = " ".join(move.get_uci_notation() for move in array_state.move_log) or "(root)"
+    assert signature(array_moves) == signature(bitboard_moves), f"move generators disagree after {line}"
+    assert (array_state.checkmate, array_state.stalemate) == (bitboard_state.checkmate, bitboard_state.stalemate), f"game end disagrees after {line}"
+    if depth == 0:
+        return 1
+
+    bitboard_by_id = {move.move_id: move for move in bitboard_moves}
+    nodes = 0
+    for move in array_moves:
+        for choice in promotion_choices(move):
+            array_state.make_move(move, promotion_choice=choice)
+            bitboard_state.make_move(bitboard_by_id[move.move_id], promotion_choice=choice)
+            nodes += perft_compare(array_state, bitboard_state, depth - 1)
+            bitboard_state.undo_move()
+            array_state.undo_move()
+    return nodes
+
+@pytest.mark.parametrize("name, fen, expected", PERFT_SUITE, ids=[name for name, _, _ in PERFT_SUITE])
+def test_generators_agree(name, fen, expected):
+    nodes = perft_compare(GameState.from_fen(fen), BitboardGameState.from_fen(fen), DEPTH)
+    assert nodes == expected[DEPTH]
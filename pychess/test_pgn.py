@@ -0,0 +1,11 @@
+import io
+from pgn import read_games
+
+def test_header_only_games_stay_apart():
+    stream = io.StringIO('[Event "first"]\n[White "a"]\n\n[Event "second"]\n[Black "b"]\n\n[Event "third"]\n\n1. e4 e5 1-0\n')
+    games = list(read_games(stream))
+    assert games == [
+        ({"Event": "first", "White": "a"}, []),
+        ({"Event": "second", "Black": "b"}, []),
+        ({"Event": "third", "Result": "1-0"}, ["e4", "e5"]),
+    ]
@@ -0,0 +1,205 @@
+import sys
+import threading
+from bitboard import BitboardGameState
+from engine import START_FEN
+import bot as ChessBot
+from book import OpeningBook
+from tablebase import Tablebases
+
+# universal chess interface front end, lets tournament managers and gui's drive the NegamaxBot
+# run with python uci.py from the pychess folder, commands come in on stdin and replies go out on stdout
+
+ENGINE_NAME = "PyChess"
+ENGINE_AUTHOR = "rip-super"
+DEFAULT_HASH_MB = 64
+MAX_THREADS = 64
+
+def send(line):
+    print(line, flush=True)
+
+def move_to_uci(move):
+    promotion = move.promotion_choice.lower() if move.is_pawn_promotion and move.promotion_choice else ""
+    return move.get_uci_notation() + promotion
+
+def find_move(game_state, uci_move):
+    for move in game_state.get_valid_moves():
+        if move.get_uci_notation() == uci_move[:4]:
+            if move.is_pawn_promotion:
+                move.promotion_choice = uci_move[4:5].upper() or "Q"
+            return move
+    return None
+
+class UCIEngine:
+    def __init__(self):
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.book_random = False
+        self.bot = ChessBot.NegamaxBot(hash_mb=self.hash_mb)
+        self.bot.verbose = False
+        self.bot.on_iteration = self.send_info
+        self.game_state = BitboardGameState.from_fen(START_FEN)
+        self.search_thread = None
+        self.infinite = False
+        self.stop_event = threading.Event() # holds back the bestmove of a go infinite until stop
+
+    def format_score(self, score, pv):
+        # scores are in pawns from the side to move, mate scores carry no distance so the pv length stands in
+        # only checkmate reaches CHECKMATE_SCORE, draws score DRAW_SCORE and go out as cp 0
+        if abs(score) >= self.bot.CHECKMATE_SCORE:
+            moves_to_mate = (len(pv) + 1) // 2
+            return f"mate {moves_to_mate if score > 0 else -moves_to_mate}"
+        return f"cp {round(score * 100)}"
+
+    def send_info(self, depth, score, nodes, elapsed, pv):
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        send(f"info depth {depth} score {self.format_score(score, pv)} nodes {nodes} nps {nps} time {int(elapsed * 1000)} pv {' '.join(move_to_uci(move) for move in pv)}")
+
+    def set_position(self, tokens):
+        if tokens and tokens[0] == "fen":
+            fen_length = tokens.index("moves") if "moves" in tokens else len(tokens) # the move counters are optional
+            fen = " ".join(tokens[1:fen_length])
+            tokens = tokens[fen_length:]
+        else:
+            fen = START_FEN
+            tokens = tokens[1:]
+
+        try:
+            game_state = BitboardGameState.from_fen(fen)
+        except ValueError as error:
+            send(f"info string {error}")
+            return
+        if tokens and tokens[0] == "moves":
+            for uci_move in tokens[1:]:
+                move = find_move(game_state, uci_move)
+                if move is None:
+                    send(f"info string illegal move {uci_move}")
+                    break
+                game_state.make_move(move, promotion_choice=move.promotion_choice)
+        self.game_state = game_state
+
+    def set_option(self, tokens):
+        # setoption name <name> value <value>
+        if "value" not in tokens:
+            return
+        value_index = tokens.index("value")
+        name = " ".join(tokens[1:value_index]).lower()
+        value = " ".join(tokens[value_index + 1:])
+        if name in ("hash", "threads"):
+            try:
+                number = int(value)
+            except ValueError:
+                send(f"info string {name} needs a whole number, not {value}")
+                return
+        if name == "hash":
+            self.hash_mb = max(1, number)
+            self.bot.resize_hash(self.hash_mb)
+            self.bot.start_helpers()
+        elif name == "threads":
+            self.threads = max(1, min(MAX_THREADS, number))
+            self.bot.set_threads(self.threads)
+            # helpers are forked here, forking from the search thread while this one sits in a stdin read hangs the child
+            self.bot.start_helpers()
+        elif name == "bookfile":
+            if self.bot.book is not None:
+                self.bot.book.close()
+            self.bot.book = None
+            if value and value != "<empty>":
+                try:
+                    self.bot.book = OpeningBook(value, random_choice=self.book_random)
+                except OSError as error:
+                    send(f"info string could not open book {value}: {error}")
+        elif name == "bookrandom":
+            self.book_random = value.lower() == "true"
+            if self.bot.book is not None:
+                self.bot.book.random_choice = self.book_random
+        elif name == "tablebasepath":
+            self.bot.stop_helpers() # helpers and pool processes get their own copy of the tables when they start
+            self.bot.tablebases = Tablebases(value) if value and value != "<empty>" else None
+            self.bot.start_helpers()
+        elif name == "rootsplit":
+            self.bot.stop_helpers()
+            self.bot.root_split = value.lower() == "true"
+            self.bot.start_helpers()
+
+    def go(self, tokens):
+        limits = {}
+        self.infinite = "infinite" in tokens
+        for name, value in zip(tokens, tokens[1:]):
+            if name in ("depth", "movetime", "wtime", "btime", "winc", "binc"):
+                try:
+                    limits[name] = int(value)
+                except ValueError:
+                    send(f"info string {name} needs a whole number, not {value}")
+                    return
+
+        white_to_move = self.game_state.white_to_move
+        self.bot.stop_requested = False
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search, kwargs={
+            "movetime": limits.get("movetime"),
+            "wtime": limits.get("wtime"),
+            "btime": limits.get("btime"),
+            "increment": limits.get("winc" if white_to_move else "binc", 0),
+            "depth": limits.get("depth"),
+            "infinite": self.infinite
+        }, daemon=True)
+        self.search_thread.start()
+
+    def search(self, **limits):
+        valid_moves = self.game_state.get_valid_moves()
+        if not valid_moves:
+            send("bestmove 0000")
+            return
+
+        best_move = self.bot.find_best_move(self.game_state, valid_moves, **limits)
+        if self.infinite:
+            self.stop_event.wait()
+        send(f"bestmove {move_to_uci(best_move)}")
+
+    def stop(self):
+        if self.search_thread is not None:
+            self.bot.stop_requested = True
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+    def run(self):
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command, tokens = tokens[0], tokens[1:]
+
+            if command == "uci":
+                send(f"id name {ENGINE_NAME}")
+                send(f"id author {ENGINE_AUTHOR}")
+                send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max 4096")
+                send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+                send("option name RootSplit type check default false")
+                send("option name BookFile type string default <empty>")
+                send("option name BookRandom type check default false")
+                send("option name TablebasePath type string default <empty>")
+                send("uciok")
+            elif command == "isready":
+                send("readyok")
+            elif command == "setoption":
+                self.set_option(tokens)
+            elif command == "ucinewgame":
+                self.stop()
+                self.bot.new_game()
+                self.bot.start_helpers() # new_game shuts down a root split pool, it is started again from this thread
+            elif command == "position":
+                self.stop()
+                self.set_position(tokens)
+            elif command == "go":
+                self.stop()
+                self.go(tokens)
+            elif command == "stop":
+                self.stop()
+            elif command == "quit":
+                self.stop()
+                self.bot.close()
+                break
+
+if __name__ == "__main__":
+    UCIEngine().run()
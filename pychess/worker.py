@@ -0,0 +1,136 @@
+import atexit
+import threading
+import weakref
+from multiprocessing import Process, Pipe
+from engine import Move
+
+# long lived search process, used by the gui and for the lazy smp helper threads
+# the worker keeps its own copy of the game and only hears about the moves played or undone since the last search,
+# so nothing big gets pickled per move and the bot's transposition table stays warm from one move to the next
+# messages to the worker: ("load", game_state), ("move", code), ("undo",), ("go", search_id, limits), ("stop",), ("new_game",), ("quit",)
+# messages back: (search_id, best_move, completed_depth, score, nodes, principal_variation)
+
+def run_worker(connection, bot):
+    game_state = None
+    search_thread = None
+
+    def search(search_id, limits):
+        valid_moves = game_state.get_valid_moves()
+        best_move = bot.find_best_move(game_state, valid_moves, **limits) if valid_moves else None
+        connection.send((search_id, best_move, bot.completed_depth, bot.best_score, bot.search_nodes, bot.principal_variation if best_move else []))
+
+    def stop_search():
+        # cooperative stop, the bot polls stop_requested and unwinds its own make_move calls
+        nonlocal search_thread
+        if search_thread is not None:
+            bot.stop_requested = True
+            search_thread.join()
+            search_thread = None
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            message = ("quit",) # the other end is gone
+        command = message[0]
+        stop_search() # the search thread shares game_state, so it has to finish before anything else runs
+
+        if command == "load":
+            game_state = message[1]
+        elif command == "move":
+            move = Move.from_code(message[1])
+            game_state.make_move(move, promotion_choice=move.promotion_choice)
+        elif command == "undo":
+            game_state.undo_move()
+        elif command == "new_game":
+            bot.new_game()
+        elif command == "go":
+            bot.stop_requested = False
+            search_thread = threading.Thread(target=search, args=(message[1], message[2]), daemon=True)
+            search_thread.start()
+        elif command == "quit":
+            bot.close()
+            break
+
+class SearchWorker:
+    def __init__(self, bot):
+        self.connection, worker_connection = Pipe()
+        # not a daemon, a bot with threads > 1 starts its own helper processes
+        self.process = Process(target=run_worker, args=(worker_connection, bot))
+        self.process.start()
+        self.closed = False
+        atexit.register(self.close) # runs before multiprocessing joins its children at exit
+        self.known_game = None # weak reference to the GameState the worker is following
+        self.known_moves = [] # move codes the worker has played, in order
+        self.search_id = 0
+        self.searching = False
+        self.result = None
+        self.result_depth = 0
+        self.result_score = 0
+        self.result_nodes = 0
+        self.result_pv = []
+
+    def sync(self, game_state):
+        # send the worker the difference between its move list and game_state's
+        codes = [move.code for move in game_state.move_log]
+        if self.known_game is None or self.known_game() is not game_state:
+            # a different game, e.g. after a reset or a new uci position, gets sent whole
+            self.connection.send(("load", game_state))
+            self.known_game = weakref.ref(game_state)
+            self.known_moves = codes
+            return
+
+        common = 0
+        while common < min(len(codes), len(self.known_moves)) and codes[common] == self.known_moves[common]:
+            common += 1
+        for _ in range(len(self.known_moves) - common):
+            self.connection.send(("undo",))
+        for code in codes[common:]:
+            self.connection.send(("move", code))
+        self.known_moves = codes
+
+    def start_search(self, game_state, **limits):
+        self.sync(game_state)
+        self.search_id += 1
+        self.searching = True
+        self.result = None
+        self.connection.send(("go", self.search_id, limits))
+
+    def new_game(self):
+        # the worker's bot forgets what it learned in the last game, a search still running is stopped first
+        self.stop()
+        self.connection.send(("new_game",))
+
+    def search_finished(self):
+        # non-blocking, results of stopped searches are dropped
+        while self.searching and self.connection.poll():
+            self.receive_result()
+        return not self.searching
+
+    def receive_result(self):
+        search_id, best_move, depth, score, nodes, pv = self.connection.recv()
+        if search_id == self.search_id:
+            self.result = best_move
+            self.result_depth = depth
+            self.result_score = score
+            self.result_nodes = nodes
+            self.result_pv = pv
+            self.searching = False
+
+    def stop(self, wait=False):
+        # with wait the result of the stopped search is kept, otherwise it gets dropped when it arrives
+        if self.searching:
+            self.connection.send(("stop",))
+            if wait:
+                while self.searching:
+                    self.receive_result()
+            self.searching = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.connection.send(("quit",))
+            except OSError:
+                pass # the worker already exited
+            self.process.join(timeout=1)